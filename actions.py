@@ -0,0 +1,218 @@
+"""
+Zentrale Warteschlange für Discord-REST-Aufrufe, die nicht sofort fertig
+sein müssen (Rollen, Ankündigungen, Auto-VCs, Berechtigungen, Webhooks).
+Handler reihen die Aktion ein und kehren sofort zurück.
+
+- Prioritäten: kleinere Zahl zuerst (INTERACTION vor ANNOUNCEMENT)
+- Pro Bucket (z.B. "channel:123") laufen höchstens `bucket_concurrency`
+  Aktionen gleichzeitig, weitere warten, ohne Worker zu blockieren
+- 429, 5xx und Netzwerkfehler werden mit exponentiellem Backoff wiederholt
+- Aktionen mit gleichem `key`, die noch nicht laufen (oder auf ihre
+  Wiederholung warten), werden zusammengefasst: es wird nur die zuletzt
+  eingereihte Funktion ausgeführt
+- `stop` bricht alles ab, was nach dem Timeout noch wartet; die Futures
+  werden dabei abgebrochen, damit niemand ewig auf sie wartet
+"""
+import asyncio
+import heapq
+import itertools
+import random
+
+import aiohttp
+import discord
+
+INTERACTION = 0
+HIGH = 1
+NORMAL = 2
+ANNOUNCEMENT = 3
+
+
+class _Action:
+    __slots__ = ("priority", "seq", "bucket", "fn", "key", "future", "attempt")
+
+    def __init__(self, priority, seq, bucket, fn, key, future):
+        self.priority = priority
+        self.seq = seq
+        self.bucket = bucket
+        self.fn = fn
+        self.key = key
+        self.future = future
+        self.attempt = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def _retryable(error: BaseException) -> bool:
+    if isinstance(error, discord.HTTPException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, OSError))
+
+
+def _copy_result(source: asyncio.Future, target: asyncio.Future):
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class ActionQueue:
+    def __init__(self, workers: int = 8, bucket_concurrency: int = 1, max_retries: int = 3, base_delay: float = 1.0):
+        self.workers = workers
+        self.bucket_concurrency = bucket_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+
+        self.ready = []  # Heap der Aktionen, die sofort laufen dürfen
+        self.parked = {}  # bucket -> Heap der Aktionen, deren Bucket voll ist
+        self.active = {}  # bucket -> Anzahl laufender Aktionen
+        self.pending = {}  # key -> noch nicht gestartete Aktion
+        self.retrying = {}  # Aktion -> TimerHandle der geplanten Wiederholung
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._tasks = []
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.failed = 0
+
+    def __len__(self):
+        return len(self.ready) + sum(len(actions) for actions in self.parked.values()) + len(self.retrying)
+
+    def submit(self, bucket: str, fn, priority: int = NORMAL, key=None) -> asyncio.Future:
+        """
+        Reiht `fn` (async, ohne Argumente) ein. Das Future liefert das Ergebnis;
+        es muss nicht abgewartet werden, Fehler werden ohnehin geloggt.
+        """
+        self.start()
+        self.submitted += 1
+        if key is not None:
+            action = self.pending.get(key)
+            if action is not None:
+                action.fn = fn
+                if priority < action.priority:
+                    self._reprioritize(action, priority)
+                self.coalesced += 1
+                return action.future
+
+        future = asyncio.get_running_loop().create_future()
+        # Fehler nicht als "never retrieved" melden, wenn niemand wartet
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        action = _Action(priority, next(self._seq), bucket, fn, key, future)
+        if key is not None:
+            self.pending[key] = action
+        self._push(action)
+        return future
+
+    def _reprioritize(self, action, priority):
+        action.priority = priority
+        heapq.heapify(self.ready)
+        if action.bucket in self.parked:
+            heapq.heapify(self.parked[action.bucket])
+
+    def _push(self, action):
+        if self.active.get(action.bucket, 0) >= self.bucket_concurrency:
+            heapq.heappush(self.parked.setdefault(action.bucket, []), action)
+        else:
+            heapq.heappush(self.ready, action)
+            self._wakeup.set()
+
+    def _release(self, bucket):
+        self.active[bucket] -= 1
+        if not self.active[bucket]:
+            del self.active[bucket]
+        parked = self.parked.get(bucket)
+        if parked:
+            heapq.heappush(self.ready, heapq.heappop(parked))
+            if not parked:
+                del self.parked[bucket]
+            self._wakeup.set()
+
+    async def _worker(self):
+        while True:
+            while not self.ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            action = heapq.heappop(self.ready)
+            if self.active.get(action.bucket, 0) >= self.bucket_concurrency:
+                # Bucket wurde inzwischen belegt
+                heapq.heappush(self.parked.setdefault(action.bucket, []), action)
+                continue
+            if action.key is not None and self.pending.get(action.key) is action:
+                del self.pending[action.key]
+            self.active[action.bucket] = self.active.get(action.bucket, 0) + 1
+            try:
+                await self._run(action)
+            finally:
+                self._release(action.bucket)
+
+    async def _run(self, action):
+        try:
+            result = await action.fn()
+        except asyncio.CancelledError:
+            action.future.cancel()
+            raise
+        except Exception as e:
+            if _retryable(e) and action.attempt < self.max_retries:
+                self._schedule_retry(action)
+                return
+            self.failed += 1
+            print(f"Action in {action.bucket} failed: {e!r}", flush=True)
+            if not action.future.done():
+                action.future.set_exception(e)
+            return
+        if not action.future.done():
+            action.future.set_result(result)
+
+    def _schedule_retry(self, action):
+        if action.key is not None:
+            newer = self.pending.get(action.key)
+            if newer is not None:
+                # während des Laufs wurde eine neuere Version eingereiht, die ersetzt die Wiederholung
+                newer.future.add_done_callback(lambda f: _copy_result(f, action.future))
+                return
+            # bis zur Wiederholung werden neue Aktionen mit dem Key hierein zusammengefasst
+            self.pending[action.key] = action
+        action.attempt += 1
+        self.retried += 1
+        delay = self.base_delay * 2 ** (action.attempt - 1) * (1 + random.random())
+        self.retrying[action] = asyncio.get_running_loop().call_later(delay, self._retry, action)
+
+    def _retry(self, action):
+        del self.retrying[action]
+        self._push(action)
+
+    def start(self):
+        if not self._tasks:
+            self._wakeup = asyncio.Event()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0):
+        """Wartet bis zu `timeout` Sekunden, bis die Warteschlange leer ist, und beendet die Worker."""
+        if not self._tasks:
+            return
+        deadline = asyncio.get_running_loop().time() + timeout
+        while (len(self) or self.active) and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # was jetzt noch wartet, wird nicht mehr ausgeführt
+        for handle in self.retrying.values():
+            handle.cancel()
+        leftover = [*self.ready, *(action for actions in self.parked.values() for action in actions), *self.retrying]
+        if leftover:
+            print(f"Action queue stopped, dropping {len(leftover)} actions", flush=True)
+        for action in leftover:
+            action.future.cancel()
+        self.ready.clear()
+        self.parked.clear()
+        self.retrying.clear()
+        self.pending.clear()
@@ -0,0 +1,57 @@
+"""
+Sperren pro Schlüssel für Read-Modify-Write im Prozess. Wer denselben
+Schlüssel (z.B. einen User einer Poll) ändert, wartet aufeinander, statt
+dass sich parallele Aufrufe gegenseitig überschreiben oder ihre
+Datenbank-Transaktionen sich gegenseitig zu Retries zwingen. Zwischen
+Prozessen sorgen Server-Inkremente bzw. Transaktionen für Atomarität.
+
+Locks werden referenzgezählt und verschwinden, sobald niemand sie hält
+oder auf sie wartet. Anzahl, Konflikte und Wartezeit landen in metrics.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import metrics
+
+
+class KeyedLocks:
+    def __init__(self, name: str):
+        self.name = name
+        self._locks = {}  # key -> [asyncio.Lock, Anzahl Halter + Wartende]
+        self.acquired = 0
+        self.contended = 0
+
+    def __len__(self):
+        return len(self._locks)
+
+    def locked(self, key) -> bool:
+        entry = self._locks.get(key)
+        return entry is not None and entry[0].locked()
+
+    @asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            lock = entry[0]
+            if lock.locked():
+                self.contended += 1
+                metrics.lock_contended.inc(self.name)
+                started = time.perf_counter()
+                await lock.acquire()
+                metrics.lock_wait.observe(time.perf_counter() - started, self.name)
+            else:
+                await lock.acquire()
+            self.acquired += 1
+            metrics.lock_acquired.inc(self.name)
+            try:
+                yield
+            finally:
+                lock.release()
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self._locks.get(key) is entry:
+                del self._locks[key]
@@ -0,0 +1,242 @@
+"""
+Stand-ins für Discord-Objekte und die Datenbank, damit die Handler aus
+main.py ohne Bot-Token und ohne Netzwerk ausgeführt werden können.
+"""
+import asyncio
+import copy
+import itertools
+from collections import Counter
+
+_ids = itertools.count(10**17)
+
+
+def _normalize(value):
+    # Die Realtime Database speichert Listen intern als {"0": .., "1": ..}
+    if isinstance(value, list):
+        return {str(i): _normalize(v) for i, v in enumerate(value)}
+    if isinstance(value, dict) and ".sv" not in value:
+        return {str(k): _normalize(v) for k, v in value.items() if v is not None}
+    return value
+
+
+class FakeDB:
+    """
+    In-Process-Baum mit derselben Schnittstelle wie AsyncFirebaseDB.
+    `latency` (Sekunden) wird vor jedem Aufruf abgewartet, `calls` zählt
+    die Aufrufe pro Operation.
+    """
+
+    def __init__(self, latency: float = 0.0, data: dict = None):
+        self.latency = latency
+        self.tree = _normalize(data or {})
+        self.calls = Counter()
+
+    async def _io(self, op: str):
+        self.calls[op] += 1
+        await asyncio.sleep(self.latency)
+
+    def _keys(self, path: str):
+        return [k for k in path.strip("/").split("/") if k]
+
+    def _get(self, path: str):
+        node = self.tree
+        for key in self._keys(path):
+            if not isinstance(node, dict) or key not in node:
+                return None
+            node = node[key]
+        return copy.deepcopy(node)
+
+    def _set(self, path: str, value):
+        keys = self._keys(path)
+        if not keys:
+            self.tree = _normalize(value) or {}
+            return
+        node = self.tree
+        for key in keys[:-1]:
+            child = node.get(key)
+            if not isinstance(child, dict):
+                child = node[key] = {}
+            node = child
+        value = _normalize(value)
+        if isinstance(value, dict) and ".sv" in value:
+            current = node.get(keys[-1]) or 0
+            node[keys[-1]] = current + value[".sv"]["increment"]
+        elif value is None or value == {}:
+            node.pop(keys[-1], None)
+        else:
+            node[keys[-1]] = value
+
+    async def get(self, path: str):
+        await self._io("get")
+        return self._get(path)
+
+    async def query(self, path: str, order_by: str, start_at):
+        await self._io("query")
+        children = self._get(path)
+        if not isinstance(children, dict):
+            return {}
+        return {key: child for key, child in children.items()
+                if isinstance(child, dict) and isinstance(child.get(order_by), (int, float)) and child[order_by] >= start_at}
+
+    async def set(self, path: str, value):
+        await self._io("set")
+        self._set(path, value)
+
+    async def update(self, path: str, value: dict):
+        if not value:
+            return
+        await self._io("update")
+        for key, child in value.items():
+            self._set(f"{path.rstrip('/')}/{key}", child)
+
+    async def delete(self, path: str):
+        await self._io("delete")
+        self._set(path, None)
+
+    async def increment(self, path: str, delta: int = 1):
+        await self._io("update")
+        self._set(path, {".sv": {"increment": delta}})
+
+    async def transaction(self, path: str, fn, max_retries: int = 25):
+        await self._io("transaction")
+        current = self._get(path)
+        new_value = fn(copy.deepcopy(current))
+        self._set(path, new_value)
+        return current, new_value
+
+    async def close(self):
+        pass
+
+
+class CountingBackend:
+    """Zählt Aufrufe auf einem echten Backend (z.B. storage.SQLiteBackend) wie FakeDB."""
+
+    def __init__(self, backend, latency: float = 0.0):
+        self.backend = backend
+        self.latency = latency
+        self.calls = Counter()
+
+    def __getattr__(self, name):
+        method = getattr(self.backend, name)
+        if name not in ("get", "query", "set", "update", "delete", "increment", "transaction"):
+            return method
+
+        async def counted(*args, **kwargs):
+            self.calls["update" if name == "increment" else name] += 1
+            await asyncio.sleep(self.latency)
+            return await method(*args, **kwargs)
+
+        return counted
+
+
+class FakeRole:
+    def __init__(self, role_id=None, name="role"):
+        self.id = role_id or next(_ids)
+        self.name = name
+        self.mention = f"<@&{self.id}>"
+
+
+class FakeMember:
+    def __init__(self, guild, member_id=None, name=None, bot=False):
+        self.id = member_id or next(_ids)
+        self.guild = guild
+        self.name = name or f"user{self.id}"
+        self.display_name = self.name
+        self.bot = bot
+        self.mention = f"<@{self.id}>"
+        self.voice = None
+
+    async def add_roles(self, *roles):
+        pass
+
+    async def move_to(self, channel):
+        if self.voice is not None and self.voice.channel is not None and self in self.voice.channel.members:
+            self.voice.channel.members.remove(self)
+        channel.members.append(self)
+        self.voice = FakeVoiceState(channel)
+
+
+class FakeTextChannel:
+    def __init__(self, guild, channel_id=None, name="general"):
+        self.id = channel_id or next(_ids)
+        self.guild = guild
+        self.name = name
+        self.mention = f"<#{self.id}>"
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+        return FakeMessage(self.guild, self, None)
+
+
+class FakeVoiceChannel:
+    def __init__(self, guild, channel_id=None, name="voice", category=None):
+        self.id = channel_id or next(_ids)
+        self.guild = guild
+        self.name = name
+        self.category = category
+        self.members = []
+
+    async def delete(self, **kwargs):
+        self.guild.channels.pop(self.id, None)
+
+
+class FakeVoiceState:
+    def __init__(self, channel=None, self_mute=False):
+        self.channel = channel
+        self.self_mute = self_mute
+
+
+class FakeGuild:
+    def __init__(self, guild_id=None, members: int = 0):
+        self.id = guild_id or next(_ids)
+        self.channels = {}
+        self.roles = {}
+        self.members = [FakeMember(self) for _ in range(members)]
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_role(self, role_id):
+        return self.roles.get(role_id)
+
+    async def create_voice_channel(self, name, category=None, **kwargs):
+        channel = FakeVoiceChannel(self, name=name, category=category)
+        self.channels[channel.id] = channel
+        return channel
+
+
+class FakeMessage:
+    def __init__(self, guild, channel, author, content="hello"):
+        self.id = next(_ids)
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.embeds = []
+        self.edits = 0
+
+    async def edit(self, **kwargs):
+        self.edits += 1
+
+
+class FakeResponse:
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, *args, **kwargs):
+        self.sent += 1
+
+    async def defer(self, *args, **kwargs):
+        pass
+
+
+class FakeInteraction:
+    def __init__(self, guild, user, message, custom_id: str, values=None):
+        self.guild = guild
+        self.user = user
+        self.message = message
+        self.data = {"custom_id": custom_id}
+        if values is not None:
+            self.data["values"] = values
+        self.response = FakeResponse()
@@ -0,0 +1,163 @@
+"""
+Benchmark für die Hot-Paths des Bots (on_message, on_voice_state_update,
+Poll-Abstimmung). Die Handler aus main.py laufen gegen FakeDB mit
+einstellbarer Latenz (oder gegen storage.SQLiteBackend) und gegen
+Fake-Discord-Objekte.
+
+Aufruf aus dem Repo-Root:
+    python -m benchmarks.hot_paths --events 5000 --latency-ms 20 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import (CountingBackend, FakeDB, FakeGuild, FakeInteraction, FakeMessage,
+                              FakeTextChannel, FakeVoiceChannel, FakeVoiceState)
+import main
+import storage
+
+
+def install(db):
+    """Ersetzt die Datenbank in main und in allen Komponenten, die sie halten."""
+    original = main.db
+    for value in list(vars(main).values()):
+        if getattr(value, "db", None) is original:
+            value.db = db
+    main.db = db
+
+    async def process_commands(message):
+        pass
+
+    # Prefix-Commands gibt es nicht, und ohne Login fehlt bot.user
+    main.bot.process_commands = process_commands
+    main.poll_refresher.window = 0
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(name: str, db, make_event, events: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    db.calls.clear()
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await make_event(i)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(events)))
+    elapsed = time.perf_counter() - started
+
+    total_calls = sum(db.calls.values())
+    per_op = ", ".join(f"{op}={count / events:.3f}" for op, count in sorted(db.calls.items()))
+    print(
+        f"{name:<22} {events / elapsed:>10.0f} ev/s   "
+        f"p50 {percentile(latencies, 0.50) * 1000:>8.3f} ms   "
+        f"p99 {percentile(latencies, 0.99) * 1000:>8.3f} ms   "
+        f"db/ev {total_calls / events:.3f} ({per_op or '-'})",
+        flush=True
+    )
+
+
+async def seed_guild(db, guild: FakeGuild, levels: dict = None, **data):
+    await db.set(f"servers/{guild.id}/data", {"levels": levels or {}, **data})
+    db.calls.clear()
+
+
+async def bench_messages(args, db, cooldown: int, name: str):
+    guild = FakeGuild(members=args.users)
+    channel = FakeTextChannel(guild)
+    await seed_guild(db, guild, {"xp_cooldown": cooldown})
+
+    async def event(i):
+        author = guild.members[i % len(guild.members)]
+        await main.on_message(FakeMessage(guild, channel, author))
+
+    await run(name, db, event, args.events, args.concurrency)
+
+
+async def bench_voice(args, db):
+    guild = FakeGuild(members=args.users)
+    create_vc = FakeVoiceChannel(guild, name="Create VC")
+    lounge = FakeVoiceChannel(guild, name="Lounge")
+    guild.channels.update({create_vc.id: create_vc, lounge.id: lounge})
+    await seed_guild(db, guild, create_vc=create_vc.id)
+
+    async def mute_toggle(i):
+        member = guild.members[i % len(guild.members)]
+        await main.on_voice_state_update(member, FakeVoiceState(lounge), FakeVoiceState(lounge, self_mute=True))
+
+    async def join_create(i):
+        member = guild.members[i % len(guild.members)]
+        member.voice = FakeVoiceState(create_vc)
+        await main.on_voice_state_update(member, FakeVoiceState(None), FakeVoiceState(create_vc))
+
+    await run("voice mute toggle", db, mute_toggle, args.events, args.concurrency)
+    await run("voice join create_vc", db, join_create, min(args.events, 1000), args.concurrency)
+
+
+async def bench_polls(args, db):
+    guild = FakeGuild(members=args.users)
+    channel = FakeTextChannel(guild)
+    await seed_guild(db, guild)
+    poll_id = "bench"
+    options = [f"option {i}" for i in range(5)]
+    await main.poll_store.create(guild.id, poll_id, "Benchmark?", options)
+    message = FakeMessage(guild, channel, None)
+
+    async def vote(i):
+        user = guild.members[i % len(guild.members)]
+        interaction = FakeInteraction(guild, user, message, f"poll:select:{poll_id}", values=[str(i % len(options))])
+        await main.handle_poll_interaction(interaction, interaction.data["custom_id"])
+
+    await run("poll vote", db, vote, args.events, args.concurrency)
+    await asyncio.sleep(0.01)
+    print(f"{'':<22} poll edits {main.poll_refresher.edits}, saved {main.poll_refresher.saved}", flush=True)
+
+
+async def amain(args):
+    if args.backend == "fake":
+        db = FakeDB(latency=args.latency_ms / 1000)
+    else:
+        db = CountingBackend(storage.create_backend(args.backend, sqlite_path=args.sqlite_path), args.latency_ms / 1000)
+    install(db)
+    print(f"backend={args.backend} events={args.events} users={args.users} latency={args.latency_ms}ms concurrency={args.concurrency}")
+    if "message" in args.scenarios:
+        await bench_messages(args, db, cooldown=60, name="message (cooldown)")
+        await bench_messages(args, db, cooldown=0, name="message (award)")
+    if "voice" in args.scenarios:
+        await bench_voice(args, db)
+    if "poll" in args.scenarios:
+        await bench_polls(args, db)
+    await main.xp_ledger.stop()
+    await main.action_queue.stop()
+    await db.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark der Event-Handler gegen eine Fake-Datenbank")
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulierte Datenbank-Latenz pro Aufruf")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--backend", default="fake", choices=["fake", "memory", "sqlite"],
+                        help="fake: FakeDB, memory/sqlite: storage.SQLiteBackend")
+    parser.add_argument("--sqlite-path", default="bench.db")
+    parser.add_argument("--scenarios", nargs="+", default=["message", "voice", "poll"],
+                        choices=["message", "voice", "poll"])
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(amain(parse_args()))
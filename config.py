@@ -0,0 +1,139 @@
+from dataclasses import dataclass, field, fields
+import schema
+
+
+@dataclass
+class LevelsConfig:
+    enabled: bool = True
+    xp_per_message: int = 5
+    xp_cooldown: int = 60
+    level_up_channel: int = 0
+    level_roles: dict = field(default_factory=dict)  # "level" -> role_id
+    xp_per_level: int = 100
+    curve: str = "linear"  # siehe levels.CURVES
+    curve_factor: float = 1.5
+    curve_table: list = field(default_factory=list)
+    level_up_message: str = "Congratulations {user}, you've reached level {level}!"
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LevelsConfig":
+        known = {f.name for f in fields(cls)}
+        config = cls(**{k: v for k, v in (data or {}).items() if k in known})
+        # nur Zahlen-Keys kommen aus der Datenbank als Liste zurück (Firebase, storage._as_array)
+        roles = config.level_roles or {}
+        if isinstance(roles, list):
+            roles = {str(i): v for i, v in enumerate(roles) if v is not None}
+        # Platzhalter "_init" ist keine Levelrolle
+        config.level_roles = {k: v for k, v in roles.items() if k != schema.PLACEHOLDER}
+        return config
+
+
+@dataclass
+class GuildConfig:
+    levels: LevelsConfig = field(default_factory=LevelsConfig)
+    create_vc: int = 0
+    supporter_role: int = 0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "GuildConfig":
+        data = data or {}
+        return cls(
+            levels=LevelsConfig.from_dict(data.get("levels", {})),
+            create_vc=data.get("create_vc", 0),
+            supporter_role=data.get("supporter_role", 0),
+        )
+
+
+class GuildConfigCache:
+    """
+    Hält die Einstellungen (`servers/{id}/data`) jeder Guild im Speicher.
+    Geladen wird einmal pro Guild, Änderungen laufen per Write-Through über
+    `update`, damit Hot-Paths wie on_message keine Config-Reads brauchen.
+    Gespeichert werden nur Abweichungen von den Defaults (siehe schema.py).
+    """
+
+    def __init__(self, db, server_defaults: dict):
+        self.db = db
+        self.server_defaults = server_defaults
+        self.configs = {}  # guild_id -> GuildConfig
+        self.outdated = {}  # guild_id -> migrierte Daten, die noch nicht geschrieben wurden
+        self.versions = {}  # guild_id -> Anzahl lokaler Änderungen, siehe refresh
+
+    async def get(self, guild_id) -> GuildConfig:
+        guild_id = str(guild_id)
+        config = self.configs.get(guild_id)
+        if config is not None:
+            return config
+
+        stored = await self.db.get(f"servers/{guild_id}/data") or {}
+        # während des awaits könnte die Guild schon geladen worden sein
+        if guild_id in self.configs:
+            return self.configs[guild_id]
+        data, outdated = schema.migrate(stored)
+        if outdated and stored:
+            self.outdated[guild_id] = data
+        config = self.configs[guild_id] = GuildConfig.from_dict(schema.overlay(self.server_defaults, data))
+        return config
+
+    async def update(self, guild_id, values: dict, section: str = None):
+        """
+        Schreibt `values` nach `servers/{id}/data` (bzw. `data/{section}`)
+        und übernimmt sie in die gecachte Config. Werte, die dem Default
+        entsprechen, werden in der Datenbank gelöscht statt gespeichert.
+        """
+        guild_id = str(guild_id)
+        self.versions[guild_id] = self.versions.get(guild_id, 0) + 1
+        config = await self.get(guild_id)
+        path = f"servers/{guild_id}/data"
+        defaults = self.server_defaults.get(section, {}) if section else self.server_defaults
+        prefix = f"{section}/" if section else ""
+
+        migrated = self.outdated.pop(guild_id, None)
+        if migrated is not None:
+            # veralteten Eintrag einmal komplett im aktuellen Schema schreiben
+            target = migrated.setdefault(section, {}) if section else migrated
+            target.update(values)
+            record = schema.strip_defaults(self.server_defaults, migrated)
+            record[schema.VERSION_KEY] = schema.SCHEMA_VERSION
+            await self.db.set(path, record)
+        else:
+            payload = {schema.VERSION_KEY: schema.SCHEMA_VERSION}
+            for key, value in values.items():
+                if isinstance(value, dict) and isinstance(defaults.get(key), dict):
+                    value = schema.strip_defaults(defaults[key], value) or None
+                elif defaults.get(key) == value:
+                    value = None
+                payload[f"{prefix}{key}"] = value
+            await self.db.update(path, payload)
+
+        target = getattr(config, section) if section else config
+        for key, value in values.items():
+            setattr(target, key, value)
+
+    def restore(self, guild_id, data: dict):
+        """Übernimmt eine Config aus dem lokalen Snapshot (siehe snapshot.py)."""
+        self.configs.setdefault(str(guild_id), GuildConfig.from_dict(data))
+
+    async def refresh(self, guild_id) -> bool:
+        """
+        Liest die Config neu aus der Datenbank. Wurde sie währenddessen lokal
+        geändert, bleibt die lokale Version. Gibt zurück, ob sich etwas geändert hat.
+        """
+        guild_id = str(guild_id)
+        version = self.versions.get(guild_id, 0)
+        stored = await self.db.get(f"servers/{guild_id}/data") or {}
+        if self.versions.get(guild_id, 0) != version:
+            return False
+        data, outdated = schema.migrate(stored)
+        if outdated and stored:
+            self.outdated[guild_id] = data
+        config = GuildConfig.from_dict(schema.overlay(self.server_defaults, data))
+        if self.configs.get(guild_id) == config:
+            return False
+        self.configs[guild_id] = config
+        return True
+
+    def invalidate(self, guild_id):
+        guild_id = str(guild_id)
+        self.configs.pop(guild_id, None)
+        self.outdated.pop(guild_id, None)
@@ -1,73 +1,139 @@
-import firebase_admin
-from firebase_admin import credentials, db
-import discord
-
-class FirebaseDB:
-    def __init__(self, db_url: str, cred_path: str, server_defaults: dict = None, user_defaults: dict = None):
-        self.cred = credentials.Certificate(cred_path)
-        try:
-            firebase_admin.get_app()
-        except ValueError:
-            firebase_admin.initialize_app(self.cred, {
-                'databaseURL': db_url
-            })
-        self.root = db.reference("/")
-        self.server_defaults = server_defaults or {}
-        self.user_defaults = user_defaults or {}
-
-        # Verhindern, dass {} abgespeichert wird -> stattdessen {"_": True}
-        if not self.server_defaults:
-            self.server_defaults = {"_init": True}
-        if not self.user_defaults:
-            self.user_defaults = {"_init": True}
-
-    def set(self, path: str, value):
+from firebase_admin import credentials
+import aiohttp
+import asyncio
+import datetime
+import json
+from storage import increment_value
+
+class AsyncFirebaseDB:
+    """
+    Nicht-blockierender Zugriff auf die Realtime Database über die REST-API.
+    Nutzt einen gepoolten aiohttp-Client (Keep-Alive), begrenzt die Anzahl
+    gleichzeitiger Requests und bricht hängende Requests nach `timeout` ab.
+    """
+
+    def __init__(self, db_url: str, cred_path: str, max_concurrency: int = 20, timeout: float = 10.0,
+                 keepalive_timeout: float = 60.0):
+        self.db_url = db_url.rstrip("/")
+        self.cred_path = cred_path
+        self._cred = None
+
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.keepalive_timeout = keepalive_timeout
+
+        self._session = None
+        self._semaphore = None
+        self._token = None
+        self._token_expiry = None
+        self._token_lock = None
+
+    @property
+    def cred(self):
+        # Credentials erst bei Bedarf laden, damit der Import ohne Schlüsseldatei klappt
+        if self._cred is None:
+            self._cred = credentials.Certificate(self.cred_path)
+        return self._cred
+
+    async def _get_session(self):
+        # Session erst im laufenden Event-Loop anlegen
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._token_lock = asyncio.Lock()
+        return self._session
+
+    async def _get_token(self):
+        async with self._token_lock:
+            now = datetime.datetime.utcnow()
+            if self._token is None or self._token_expiry is None or self._token_expiry - now < datetime.timedelta(seconds=60):
+                # get_access_token() macht selbst einen blockierenden HTTP-Call -> Executor
+                loop = asyncio.get_running_loop()
+                info = await loop.run_in_executor(None, self.cred.get_access_token)
+                self._token = info.access_token
+                self._token_expiry = info.expiry
+            return self._token
+
+    def _url(self, path: str) -> str:
+        path = path.strip("/")
+        return f"{self.db_url}/{path}.json" if path else f"{self.db_url}/.json"
+
+    async def _request(self, method: str, path: str, value=None, params: dict = None, headers: dict = None):
+        session = await self._get_session()
+        query = {"access_token": await self._get_token()}
+        if params:
+            query.update(params)
+        kwargs = {"params": query}
+        if headers:
+            kwargs["headers"] = headers
+        if value is not None:
+            kwargs["data"] = json.dumps(value)
+        async with self._semaphore:
+            async with session.request(method, self._url(path), **kwargs) as resp:
+                resp.raise_for_status()
+                return await resp.json(content_type=None)
+
+    async def get(self, path: str):
+        return await self._request("GET", path)
+
+    async def query(self, path: str, order_by: str, start_at):
+        # braucht ".indexOn": [order_by] in den Regeln, sonst antwortet der Server mit 400 "Index not defined"
+        result = await self._request("GET", path, params={"orderBy": json.dumps(order_by), "startAt": json.dumps(start_at)})
+        return result or {}
+
+    async def set(self, path: str, value):
         # leeres dict vermeiden
         if isinstance(value, dict) and len(value) == 0:
             value = {"_init": True}
-        ref = self.root.child(path)
-        ref.set(value)
+        await self._request("PUT", path, value, params={"print": "silent"})
 
-    def get(self, path: str):
-        ref = self.root.child(path)
-        return ref.get()
-
-    def update(self, path: str, value: dict):
+    async def update(self, path: str, value: dict):
         # leeres dict vermeiden
         if isinstance(value, dict) and len(value) == 0:
             return
-        ref = self.root.child(path)
-        ref.update(value)
+        await self._request("PATCH", path, value, params={"print": "silent"})
+
+    async def delete(self, path: str):
+        await self._request("DELETE", path)
 
-    def delete(self, path: str):
-        ref = self.root.child(path)
-        ref.delete()
+    async def increment(self, path: str, delta: int = 1):
+        # serverseitiges Inkrement, kein Read-Modify-Write nötig
+        parent, _, key = path.strip("/").rpartition("/")
+        await self.update(parent, {key: increment_value(delta)})
 
-    async def init(self, bot: discord.Bot):
+    async def transaction(self, path: str, fn, max_retries: int = 25):
         """
-        Initialisiert die Datenbankstruktur:
-        - Für jede Guild einen Servereintrag
-        - Für jeden User in jeder Guild einen Usereintrag
+        Führt `fn(aktueller_wert) -> neuer_wert` atomar auf `path` aus
+        (optimistisch über ETags, bei Konflikt mit dem neuen Wert wiederholen).
+        Gibt (alter Wert, neuer Wert) zurück.
         """
-        print(self.server_defaults)
-        for guild in bot.guilds:
-            server_path = f"servers/{guild.id}"
-            # Server eintragen
-            if not self.get(server_path):
-                self.set(server_path, {"data": self.server_defaults, "users": {"_init": True}})
-            else:
-                self.update(f"{server_path}/data", self.server_defaults)
-
-            for member in guild.members:
-                if member.bot:
-                    continue
-                user_path = f"{server_path}/users/{member.id}"
-                if not self.get(user_path):
-                    self.set(user_path, self.user_defaults)
-                else:
-                    # neue keys hinzufügen, ohne existierende zu löschen
-                    current_data = self.get(user_path) or {}
-                    for key, value in self.user_defaults.items():
-                        if key not in current_data:
-                            current_data[key] = value
-                    self.set(user_path, current_data)
+        session = await self._get_session()
+        url = self._url(path)
+        async with self._semaphore:
+            async with session.get(url, params={"access_token": await self._get_token()},
+                                   headers={"X-Firebase-ETag": "true"}) as resp:
+                resp.raise_for_status()
+                etag = resp.headers["ETag"]
+                current = await resp.json(content_type=None)
+
+        for _ in range(max_retries):
+            new_value = fn(current)
+            async with self._semaphore:
+                async with session.put(url, params={"access_token": await self._get_token()},
+                                       headers={"if-match": etag}, data=json.dumps(new_value)) as resp:
+                    if resp.status == 412:
+                        # jemand anderes war schneller -> mit aktuellem Stand nochmal
+                        etag = resp.headers["ETag"]
+                        current = await resp.json(content_type=None)
+                        continue
+                    resp.raise_for_status()
+                    return current, new_value
+        raise RuntimeError(f"Transaction on {path} failed after {max_retries} retries")
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
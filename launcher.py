@@ -0,0 +1,190 @@
+"""
+Startet den Bot in mehreren Prozessen (Clustern), jeder mit einem Teil der
+Shards, damit mehrere CPU-Kerne genutzt werden. Die Cluster teilen sich nur
+die Datenbank; jede Guild gehört genau zu einem Shard und damit zu genau
+einem Prozess. Darauf verlassen sich die Caches und Schreibpuffer pro
+Guild (z.B. die absoluten XP-Writes in xp.XPLedger), die Shards eines
+Clusters dürfen sich deshalb nie mit denen eines anderen überschneiden.
+Slash-Commands synchronisiert nur Cluster 0.
+
+Umgebungsvariablen:
+- SHARD_COUNT: Anzahl Shards insgesamt (Standard: Empfehlung von Discord)
+- CLUSTERS: Anzahl Prozesse (Standard: Anzahl CPU-Kerne, höchstens SHARD_COUNT)
+- PORT: Port des Launchers; Cluster i lauscht auf PORT + 1 + i
+
+Der Launcher bietet /health, /ready und /stats über alle Cluster hinweg
+an und startet abgestürzte Cluster neu.
+"""
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+import dotenv
+from aiohttp import web
+
+try:
+    dotenv.load_dotenv('etc/secrets/secrets.env')
+except:
+    pass
+
+
+async def recommended_shards(token: str) -> int:
+    async with aiohttp.ClientSession() as session:
+        async with session.get("https://discord.com/api/v10/gateway/bot", headers={"Authorization": f"Bot {token}"}) as resp:
+            resp.raise_for_status()
+            return (await resp.json())["shards"]
+
+
+def split_shards(shard_count: int, clusters: int) -> list:
+    """Verteilt die Shards 0..shard_count-1 in zusammenhängenden Blöcken auf die Cluster."""
+    size, rest = divmod(shard_count, clusters)
+    result, start = [], 0
+    for i in range(clusters):
+        end = start + size + (1 if i < rest else 0)
+        result.append(list(range(start, end)))
+        start = end
+    return result
+
+
+class Cluster:
+    def __init__(self, index: int, shard_ids: list, shard_count: int, port: int):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.port = port
+        self.process = None
+        self.restarts = 0
+        self.started_at = 0.0
+
+    async def start(self):
+        env = dict(os.environ,
+                   SHARD_IDS=",".join(map(str, self.shard_ids)),
+                   SHARD_COUNT=str(self.shard_count),
+                   PORT=str(self.port),
+                   CLUSTER_ID=str(self.index))
+        self.process = await asyncio.create_subprocess_exec(sys.executable, "main.py", env=env)
+        self.started_at = time.monotonic()
+        print(f"Cluster {self.index} started (pid {self.process.pid}, shards {self.shard_ids}, port {self.port})", flush=True)
+
+    async def supervise(self, max_backoff: float = 60.0):
+        """Startet den Prozess neu, wenn er endet; Backoff wächst bei schnellen Abstürzen."""
+        backoff = 1.0
+        while True:
+            code = await self.process.wait()
+            print(f"Cluster {self.index} exited with code {code}", flush=True)
+            # lief der Prozess eine Weile stabil, wieder mit kurzem Backoff beginnen
+            backoff = 1.0 if time.monotonic() - self.started_at > 300 else min(backoff * 2, max_backoff)
+            await asyncio.sleep(backoff)
+            self.restarts += 1
+            await self.start()
+
+    async def fetch(self, session, path: str):
+        try:
+            async with session.get(f"http://127.0.0.1:{self.port}{path}", timeout=aiohttp.ClientTimeout(total=5)) as resp:
+                return resp.status, await resp.json()
+        except Exception as e:
+            return None, {"error": repr(e)}
+
+    def stop(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+
+
+def create_app(clusters: list) -> web.Application:
+    routes = web.RouteTableDef()
+    session = None
+
+    async def collect(path: str) -> list:
+        nonlocal session
+        if session is None:
+            session = aiohttp.ClientSession()
+        return await asyncio.gather(*(cluster.fetch(session, path) for cluster in clusters))
+
+    def describe(cluster, status, data) -> dict:
+        return {
+            "cluster": cluster.index,
+            "shards": cluster.shard_ids,
+            "port": cluster.port,
+            "pid": cluster.process.pid if cluster.process else None,
+            "restarts": cluster.restarts,
+            "status": status,
+            **data
+        }
+
+    @routes.get("/")
+    async def home(request):
+        return web.Response(text="Bot is running!")
+
+    @routes.get("/health")
+    async def health(request):
+        alive = [cluster.process is not None and cluster.process.returncode is None for cluster in clusters]
+        return web.json_response({"status": "ok" if all(alive) else "degraded", "alive": sum(alive), "clusters": len(clusters)},
+                                 status=200 if all(alive) else 503)
+
+    @routes.get("/ready")
+    async def ready(request):
+        results = await collect("/ready")
+        is_ready = all(status == 200 for status, _ in results)
+        return web.json_response({
+            "ready": is_ready,
+            "clusters": [describe(cluster, status, data) for cluster, (status, data) in zip(clusters, results)]
+        }, status=200 if is_ready else 503)
+
+    @routes.get("/stats")
+    async def stats(request):
+        results = await collect("/stats")
+        return web.json_response({
+            "guilds": sum(data.get("guilds", 0) for status, data in results if status == 200),
+            "clusters": [describe(cluster, status, data) for cluster, (status, data) in zip(clusters, results)]
+        })
+
+    async def close_session(app):
+        if session is not None:
+            await session.close()
+
+    app = web.Application()
+    app.add_routes(routes)
+    app.on_cleanup.append(close_session)
+    return app
+
+
+async def main():
+    token = os.getenv("BOT_TOKEN")
+    shard_count = os.getenv("SHARD_COUNT")
+    if shard_count and shard_count != "auto":
+        shard_count = int(shard_count)
+    elif token:
+        shard_count = await recommended_shards(token)
+    else:
+        raise ValueError("BOT_TOKEN not found in environment!")
+
+    cluster_count = max(1, min(int(os.getenv("CLUSTERS", os.cpu_count() or 1)), shard_count))
+    port = int(os.getenv("PORT", 10000))
+    clusters = [Cluster(i, shard_ids, shard_count, port + 1 + i)
+                for i, shard_ids in enumerate(split_shards(shard_count, cluster_count))]
+    print(f"Launching {shard_count} shards in {cluster_count} clusters", flush=True)
+
+    runner = web.AppRunner(create_app(clusters), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "0.0.0.0", port).start()
+
+    try:
+        for cluster in clusters:
+            await cluster.start()
+            # Discord erlaubt nur einen Identify alle 5 Sekunden
+            await asyncio.sleep(5 * len(cluster.shard_ids))
+        await asyncio.gather(*(cluster.supervise() for cluster in clusters))
+    finally:
+        for cluster in clusters:
+            cluster.stop()
+        await asyncio.gather(*(cluster.process.wait() for cluster in clusters if cluster.process), return_exceptions=True)
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
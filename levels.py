@@ -0,0 +1,103 @@
+import math
+from bisect import bisect_right
+from functools import lru_cache
+
+CURVES = ("linear", "quadratic", "exponential", "table")
+
+
+class LinearCurve:
+    """Level L braucht L * xp_per_level XP."""
+
+    def __init__(self, xp_per_level: int):
+        self.xp_per_level = xp_per_level
+
+    def xp_for_level(self, level: int) -> int:
+        return level * self.xp_per_level
+
+    def level_for_xp(self, xp: int) -> int:
+        return max(0, xp // self.xp_per_level)
+
+
+class QuadraticCurve:
+    """Level L braucht L² * xp_per_level XP."""
+
+    def __init__(self, xp_per_level: int):
+        self.xp_per_level = xp_per_level
+
+    def xp_for_level(self, level: int) -> int:
+        return level * level * self.xp_per_level
+
+    def level_for_xp(self, xp: int) -> int:
+        if xp <= 0:
+            return 0
+        return math.isqrt(xp // self.xp_per_level)
+
+
+class ExponentialCurve:
+    """Jedes Level kostet `factor`-mal so viel wie das vorherige, Level 1 kostet xp_per_level."""
+
+    def __init__(self, xp_per_level: int, factor: float):
+        self.xp_per_level = xp_per_level
+        self.factor = factor
+
+    def xp_for_level(self, level: int) -> int:
+        # geometrische Reihe xp_per_level * (1 + f + ... + f^(L-1))
+        return int(self.xp_per_level * (self.factor ** level - 1) / (self.factor - 1))
+
+    def level_for_xp(self, xp: int) -> int:
+        if xp <= 0:
+            return 0
+        level = int(math.log(xp * (self.factor - 1) / self.xp_per_level + 1, self.factor))
+        # Rundungsfehler von log ausgleichen
+        while self.xp_for_level(level + 1) <= xp:
+            level += 1
+        while level > 0 and self.xp_for_level(level) > xp:
+            level -= 1
+        return level
+
+
+class TableCurve:
+    """
+    Feste Schwellen: thresholds[i] ist die XP für Level i + 1.
+    Nach dem Ende der Tabelle geht es linear mit dem letzten Abstand weiter.
+    """
+
+    def __init__(self, thresholds: tuple):
+        self.thresholds = tuple(thresholds)
+        if len(self.thresholds) > 1:
+            self.step = self.thresholds[-1] - self.thresholds[-2]
+        else:
+            self.step = self.thresholds[-1]
+
+    def xp_for_level(self, level: int) -> int:
+        if level <= 0:
+            return 0
+        if level <= len(self.thresholds):
+            return self.thresholds[level - 1]
+        return self.thresholds[-1] + (level - len(self.thresholds)) * self.step
+
+    def level_for_xp(self, xp: int) -> int:
+        if xp < self.thresholds[-1]:
+            return bisect_right(self.thresholds, xp)
+        return len(self.thresholds) + (xp - self.thresholds[-1]) // self.step
+
+
+@lru_cache(maxsize=256)
+def get_curve(curve: str, xp_per_level: int, factor: float = 1.5, table: tuple = ()):
+    if curve == "quadratic":
+        return QuadraticCurve(xp_per_level)
+    if curve == "exponential" and factor > 1:
+        return ExponentialCurve(xp_per_level, factor)
+    if curve == "table" and table:
+        return TableCurve(table)
+    return LinearCurve(xp_per_level)
+
+
+def curve_for(levels_config):
+    """Kurve passend zu einer LevelsConfig (gecached, also billig im Hot-Path)."""
+    return get_curve(
+        levels_config.curve,
+        levels_config.xp_per_level,
+        levels_config.curve_factor,
+        tuple(levels_config.curve_table or ())
+    )
@@ -1,12 +1,27 @@
 import discord
 from discord.ext import commands
 from typing import Optional
-import firebase
+import storage
+import xp
+import config
+import actions
+import polls
+import tickets
+import webhooks
+import voice
+import purge
+import snapshot
+import levels
+import ranking
+import metrics
+import permissions
+import webserver
 import os
 import dotenv
 import random
 import string
-import aiohttp
+import asyncio
+import time
 
 cred_path = 'etc/secrets/db_key.json' 
 db_url = 'https://tiger-a3c02-default-rtdb.europe-west1.firebasedatabase.app/'
@@ -18,6 +33,9 @@ server_defaults = {
         "level_up_channel": 0,
         "level_roles": {"_init": True},
         "xp_per_level": 100,
+        "curve": "linear",
+        "curve_factor": 1.5,
+        "curve_table": [],
         "level_up_message": "Congratulations {user}, you've reached level {level}!"
     },
     "create_vc": 0,
@@ -39,160 +57,261 @@ if os.getenv('PYTHON_VERSION') is not None:
     cred_path = '/etc/secrets/db_key.json'
 
 TOKEN = os.getenv('BOT_TOKEN')
-firebase_db = firebase.FirebaseDB(db_url, cred_path, server_defaults, user_defaults)
+# STORAGE_BACKEND=firebase|sqlite|memory, siehe storage.py
+db = metrics.InstrumentedBackend(storage.create_backend(
+    db_url=db_url,
+    cred_path=cred_path,
+    max_concurrency=int(os.getenv('DB_MAX_CONCURRENCY', 20)),
+    timeout=float(os.getenv('DB_TIMEOUT', 10))
+))
 intents = discord.Intents.default()
 intents.message_content = True  # Enable access to message content
 
-bot = commands.Bot(command_prefix='!', intents=intents)
+# Sharding: SHARD_COUNT=auto oder Anzahl, SHARD_IDS=0,1,2 für die Shards dieses Prozesses (siehe launcher.py).
+# Jeder Prozess bekommt nur die Events seiner Guilds, Caches und Puffer sind damit pro Shard getrennt.
+SHARD_COUNT = os.getenv('SHARD_COUNT')
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv('SHARD_IDS', '').split(',') if shard_id.strip()] or None
+SHARDED = bool(SHARD_COUNT or SHARD_IDS)
+if SHARD_IDS and not (SHARD_COUNT or '').isdigit():
+    raise ValueError("SHARD_IDS requires a numeric SHARD_COUNT!")
+# Slash-Commands sind global, nur ein Cluster synchronisiert sie
+CLUSTER_ID = os.getenv('CLUSTER_ID')
+
+class TigerBot(commands.AutoShardedBot if SHARDED else commands.Bot):
+    # py-cord fängt Fehler der Commands selbst ab und meldet sie als Event,
+    # der Status für command_latency kommt deshalb aus den beiden Events
+    async def invoke_application_command(self, ctx):
+        ctx.started_at = time.perf_counter()
+        await super().invoke_application_command(ctx)
+
+    def _observe_command(self, ctx, status: str):
+        started = getattr(ctx, "started_at", None)
+        if started is not None and ctx.command is not None:
+            metrics.command_latency.observe(time.perf_counter() - started, ctx.command.qualified_name, status)
+
+    async def on_application_command_completion(self, ctx):
+        self._observe_command(ctx, "ok")
+
+    async def on_application_command_error(self, ctx, exception):
+        self._observe_command(ctx, "error")
+        await super().on_application_command_error(ctx, exception)
+
+    async def close(self):
+        # gepufferte XP und ausstehende Discord-Aktionen vor dem Beenden abarbeiten
+        await xp_ledger.stop()
+        if snapshot_store is not None:
+            if hasattr(self, "snapshot_task"):
+                self.snapshot_task.cancel()
+            await snapshot.save(snapshot_store, guild_configs, xp_ledger, poll_store)
+        temp_vcs.stop()
+        await purge_manager.stop()
+        await poll_refresher.stop()
+        await action_queue.stop()
+        await super().close()
+        # Datenbankverbindung sauber schließen
+        await db.close()
+
+if SHARDED:
+    bot = TigerBot(
+        command_prefix='!', intents=intents, shard_ids=SHARD_IDS,
+        shard_count=int(SHARD_COUNT) if SHARD_COUNT and SHARD_COUNT.isdigit() else None
+    )
+else:
+    bot = TigerBot(command_prefix='!', intents=intents)
+metrics.install_rate_limit_counter()
+metrics.registry.register(metrics.Gauge("tigerbot_gateway_latency_seconds", "Discord gateway heartbeat latency", lambda: bot.latency))
+metrics.registry.register(metrics.Gauge("tigerbot_guilds", "Number of guilds the bot is in", lambda: len(bot.guilds)))
+guild_configs = config.GuildConfigCache(db, server_defaults)
+action_queue = actions.ActionQueue(
+    workers=int(os.getenv('ACTION_WORKERS', 8)),
+    max_retries=int(os.getenv('ACTION_MAX_RETRIES', 3))
+)
+metrics.registry.register(metrics.Gauge("tigerbot_action_queue_depth", "Discord actions waiting in the queue", lambda: len(action_queue)))
+metrics.registry.register(metrics.Gauge("tigerbot_actions_coalesced", "Discord actions merged into a pending one", lambda: action_queue.coalesced))
+metrics.registry.register(metrics.Gauge("tigerbot_actions_retried", "Discord actions retried after 429/5xx", lambda: action_queue.retried))
+metrics.registry.register(metrics.Gauge("tigerbot_actions_failed", "Discord actions that failed permanently", lambda: action_queue.failed))
+poll_store = polls.PollStore(db)
+webhook_pool = webhooks.WebhookPool()
+temp_vcs = voice.TempVCRegistry(db)
+purge_manager = purge.PurgeManager(db, action_queue, delete_interval=float(os.getenv('PURGE_DELETE_INTERVAL', 0.5)))
+ticket_store = tickets.TicketStore(db)
+leaderboard = ranking.Leaderboard(db)
+xp_cooldowns = xp.CooldownTable(
+    max_users_per_guild=int(os.getenv('XP_COOLDOWN_MAX_USERS', 10000)),
+    max_idle=float(os.getenv('XP_COOLDOWN_MAX_IDLE', 3600))
+)
+xp_ledger = xp.XPLedger(
+    db, user_defaults,
+    flush_interval=float(os.getenv('XP_FLUSH_INTERVAL', 30)),
+    flush_threshold=int(os.getenv('XP_FLUSH_THRESHOLD', 50))
+)
+# Warmstart-Snapshot (snapshot.py), SNAPSHOT=0 schaltet ihn ab; ein Snapshot pro Cluster
+snapshot_store = None
+if os.getenv('SNAPSHOT') != '0':
+    snapshot_store = snapshot.Snapshot(os.getenv('SNAPSHOT_PATH') or (
+        f"data/snapshot-{CLUSTER_ID}.db" if CLUSTER_ID else "data/snapshot.db"
+    ))
 
 @bot.event
+@metrics.timed("on_ready")
 async def on_ready():
-    await firebase_db.init(bot)
+    # nur einmal pro Prozess, on_ready kommt auch nach jedem Reconnect
+    if os.getenv('DB_COMPACT') == '1' and not hasattr(bot, "compacted"):
+        bot.compacted = True
+        await storage.compact_guilds(db, bot.guilds, server_defaults, user_defaults,
+                                     concurrency=int(os.getenv('DB_INIT_CONCURRENCY', 5)), guard=xp_ledger.writing)
     print('Logged into Database!')
-    synced = await bot.sync_commands()
-    print(f'Synced commands!')
+    xp_ledger.start()
+    temp_vcs.start(sweep_temp_vcs, interval=float(os.getenv('TEMP_VC_SWEEP_INTERVAL', 300)),
+                   guild_ids=[guild.id for guild in bot.guilds], concurrency=int(os.getenv('DB_INIT_CONCURRENCY', 5)))
+    if not purge_manager.resumed:
+        await purge_manager.resume(bot)
+    if not hasattr(bot, "loop_lag_task"):
+        bot.loop_lag_task = asyncio.create_task(metrics.watch_loop_lag())
+    if CLUSTER_ID in (None, "0"):
+        await bot.sync_commands()
+        print(f'Synced commands!')
     bot.add_view(SupportTicketView())
     bot.add_view(SettingsView())
     bot.add_view(TicketView())
     bot.add_view(AcceptRulesView())
-    
-    for guild in bot.guilds:
-        polls = firebase_db.get(f"servers/{guild.id}/polls") or {}
-        for poll_id, poll_data in polls.items():
-            options = poll_data.get("options", [])
-            bot.add_view(PollView(poll_id, options))
-
-    print(f'Logged in as {bot.user.name}')
 
-@bot.event
-async def on_guild_join(guild):
-    server_path = f"servers/{guild.id}"
-    if not firebase_db.get(server_path):
-        firebase_db.set(server_path, {"data": server_defaults, "users": {"_init": True}})
+    if SHARDED:
+        print(f'Logged in as {bot.user.name} (shards {bot.shard_ids or "all"} of {bot.shard_count})')
     else:
-        firebase_db.update(f"{server_path}/data", server_defaults)
-    for member in guild.members:
-        user_path = f"{server_path}/users/{member.id}"
-        if not firebase_db.get(user_path):
-            firebase_db.set(user_path, user_defaults)
-        else:
-            firebase_db.update(user_path, user_defaults)
+        print(f'Logged in as {bot.user.name}')
 
 @bot.event
-async def on_member_join(member):
-    server_path = f"servers/{member.guild.id}"
-    user_path = f"{server_path}/users/{member.id}"
-    if not firebase_db.get(user_path):
-        firebase_db.set(user_path, user_defaults)
-    else:
-        firebase_db.update(user_path, user_defaults)
+@metrics.timed("on_guild_join")
+async def on_guild_join(guild):
+    # Server- und Usereinträge entstehen erst beim ersten Schreiben, Defaults kommen beim Lesen dazu
+    guild_configs.invalidate(guild.id)
 
 @bot.event
+@metrics.timed("on_message")
 async def on_message(message):
     if message.author.bot:
         return
 
-    server_path = f"servers/{message.guild.id}"
-    user_path = f"{server_path}/users/{message.author.id}"
-
-    user_data = firebase_db.get(user_path)
-    if not user_data:
-        firebase_db.set(user_path, user_defaults)
-        user_data = user_defaults
-
-    server_data = firebase_db.get(server_path)
-    if not server_data:
-        firebase_db.set(server_path, {"data": server_defaults, "users": {"_init": True}})
-        server_data = {"data": server_defaults}
-
-    levels_config = server_data["data"].get("levels", {})
-    if levels_config.get("enabled", False):
-        import time
-        current_time = int(time.time())
-        last_message_time = user_data.get("last_message_time", 0)
-        xp_cooldown = levels_config.get("xp_cooldown", 60)
-
-        if current_time - last_message_time >= xp_cooldown:
-            xp_per_message = levels_config.get("xp_per_message", 5)
-            new_xp = user_data.get("xp", 0) + xp_per_message
-            new_level = user_data.get("level", 0)
-
-            xp_per_level = levels_config.get("xp_per_level", 100)
-            while new_xp >= (new_level + 1) * xp_per_level:
-                new_level += 1
-
-            firebase_db.update(user_path, {
-                "xp": new_xp,
-                "level": new_level,
-                "last_message_time": current_time
-            })
-
-            if new_level > user_data.get("level", 0):
-                level_up_channel_id = levels_config.get("level_up_channel")
+    levels_config = (await guild_configs.get(message.guild.id)).levels
+    current_time = int(time.time())
+    # Nachrichten im Cooldown gar nicht erst bis zur Datenbank lassen
+    if levels_config.enabled and not xp_cooldowns.in_cooldown(message.guild.id, message.author.id, levels_config.xp_cooldown, current_time):
+        user_data = await xp_ledger.get_user(message.guild.id, message.author.id)
+        last_message_time = user_data.last_message_time
+
+        if current_time - last_message_time >= levels_config.xp_cooldown:
+            xp_cooldowns.touch(message.guild.id, message.author.id, current_time)
+            old_level, new_level, new_xp = xp_ledger.award(
+                message.guild.id, message.author.id,
+                levels_config.xp_per_message, levels.curve_for(levels_config), current_time
+            )
+            leaderboard.update(message.guild.id, message.author.id, new_xp)
+
+            if new_level > old_level:
+                level_up_channel_id = levels_config.level_up_channel
                 if level_up_channel_id:
                     channel = bot.get_channel(level_up_channel_id)
                     if channel:
-                        text = levels_config.get("level_up_message", "Congratulations {user}, you've reached level {level}({xp} XP)!")
+                        text = levels_config.level_up_message
                         text = text.replace("{user}", message.author.mention).replace("{level}", str(new_level)).replace("{xp}", str(new_xp))
                         embed = discord.Embed(title="Level Up!", description=text, color=discord.Color.gold())
-                        await channel.send(embed=embed)
+                        action_queue.submit(f"channel:{channel.id}", lambda: channel.send(embed=embed), priority=actions.ANNOUNCEMENT)
 
-                level_roles = levels_config.get("level_roles", {})
-                role_id = level_roles.get(str(new_level), None)
+                role_id = levels_config.level_roles.get(str(new_level), None)
                 if role_id:
                     role = message.guild.get_role(role_id)
                     if role:
-                        await message.author.add_roles(role)
-                        await message.channel.send(f"{message.author.mention} has been given the role {role.name} for reaching level {new_level}!")
+                        action_queue.submit(
+                            f"guild:{message.guild.id}:members", lambda: grant_level_role(message, role, new_level),
+                            key=("role", message.guild.id, message.author.id, role.id)
+                        )
 
     await bot.process_commands(message)
 
+async def grant_level_role(message, role, level):
+    await message.author.add_roles(role)
+    action_queue.submit(
+        f"channel:{message.channel.id}",
+        lambda: message.channel.send(f"{message.author.mention} has been given the role {role.name} for reaching level {level}!"),
+        priority=actions.ANNOUNCEMENT
+    )
+
 @bot.event
+@metrics.timed("on_voice_state_update")
 async def on_voice_state_update(member, before, after):
-    server_path = f"servers/{member.guild.id}"
-    user_path = f"{server_path}/users/{member.id}"
-
-    user_data = firebase_db.get(user_path)
-    if not user_data:
-        firebase_db.update(user_path, user_defaults)
-        user_data = user_defaults
-
-    server_data = firebase_db.get(server_path)
-    if not server_data:
-        firebase_db.update(server_path, {"data": server_defaults, "users": {"_init": True}})
-        server_data = {"data": server_defaults}
-
-    create_vc_channel_id = server_data["data"].get("create_vc", 0)
-    if create_vc_channel_id == 0:
+    # Mute, Deafen, Stream usw. ändern den Channel nicht
+    if before.channel == after.channel:
         return
 
     # Auto-VC erstellen, wenn jemand im "create_vc" Channel joint
-    if before.channel is None and after.channel is not None:
-        if after.channel.id == create_vc_channel_id:
-            new_vc = await member.guild.create_voice_channel(
-                name=f"{member.name}'s VC",
-                category=after.channel.category
+    if after.channel is not None:
+        create_vc_channel_id = (await guild_configs.get(member.guild.id)).create_vc
+        if create_vc_channel_id and after.channel.id == create_vc_channel_id:
+            action_queue.submit(
+                f"guild:{member.guild.id}:channels", lambda: create_auto_vc(member, after.channel),
+                priority=actions.HIGH, key=("create_vc", member.guild.id, member.id)
             )
-            await member.move_to(new_vc)
 
     # Prüfen, ob ein Auto-VC leer ist → löschen
     if before.channel is not None and len(before.channel.members) == 0:
-        if before.channel.name.endswith("'s VC"):
-            await before.channel.delete()
+        if temp_vcs.is_temp(member.guild.id, before.channel.id):
+            channel = before.channel
+            action_queue.submit(f"channel:{channel.id}", lambda: delete_auto_vc(channel), key=("delete_vc", channel.id))
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    await temp_vcs.remove(channel.guild.id, channel.id)
+
+async def create_auto_vc(member, create_channel):
+    # der User könnte den Channel schon wieder verlassen haben
+    if member.voice is None or member.voice.channel != create_channel:
+        return
+    new_vc = await member.guild.create_voice_channel(
+        name=f"{member.name}'s VC",
+        category=create_channel.category
+    )
+    # ab hier darf nichts mehr nach oben durchschlagen: die Queue würde die
+    # ganze Aktion wiederholen und einen zweiten Channel anlegen
+    moved = True
+    try:
+        await member.move_to(new_vc)
+    except discord.HTTPException as e:
+        moved = False
+        print(f"Could not move {member} to {new_vc.name}: {e}", flush=True)
+    try:
+        # im Speicher ist der Channel danach auf jeden Fall, der Sweep räumt ihn also auf
+        await temp_vcs.add(member.guild.id, new_vc.id, member.id)
+    except Exception as e:
+        print(f"Could not persist auto-VC {new_vc.id}: {e}", flush=True)
+    if not moved:
+        action_queue.submit(f"channel:{new_vc.id}", lambda: delete_auto_vc(new_vc), key=("delete_vc", new_vc.id))
+
+async def delete_auto_vc(channel):
+    # erst beim Ausführen prüfen, inzwischen könnte jemand gejoint sein
+    if len(channel.members) == 0:
+        await channel.delete()
+        await temp_vcs.remove(channel.guild.id, channel.id)
+
+async def sweep_temp_vcs():
+    """Löscht leere Auto-VCs und vergisst solche, die es nicht mehr gibt."""
+    for guild_id, channel_id in temp_vcs.items():
+        guild = bot.get_guild(guild_id)
+        if guild is None:
+            # Guild ist auf einem anderen Shard oder der Bot wurde entfernt
+            continue
+        channel = guild.get_channel(channel_id)
+        if channel is None:
+            await temp_vcs.remove(guild_id, channel_id)
+        elif len(channel.members) == 0:
+            action_queue.submit(f"channel:{channel.id}", lambda channel=channel: delete_auto_vc(channel), key=("delete_vc", channel.id))
 
 class LevelSettingsView(discord.ui.View):
     @discord.ui.button(label="Enable/Disable Levels", style=discord.ButtonStyle.red)
     async def toggle_levels(self, button, interaction):
-        server_path = f"servers/{interaction.guild.id}"
-        server_data = firebase_db.get(server_path)
-        if not server_data:
-            firebase_db.set(server_path, {"data": server_defaults, "users": {"_init": True}})
-            server_data = {"data": server_defaults}
-
-        levels_config = server_data["data"].get("levels", {})
-        current_status = levels_config.get("enabled", False)
-        new_status = not current_status
-        firebase_db.update(f"{server_path}/data/levels", {"enabled": new_status})
+        levels_config = (await guild_configs.get(interaction.guild.id)).levels
+        new_status = not levels_config.enabled
+        await guild_configs.update(interaction.guild.id, {"enabled": new_status}, section="levels")
 
         status_text = "enabled" if new_status else "disabled"
         await interaction.response.send_message(f"Levels have been {status_text}.", ephemeral=True)
@@ -230,6 +349,17 @@ class LevelSettingsView(discord.ui.View):
 
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
+    @discord.ui.button(label="Level Curve", style=discord.ButtonStyle.blurple)
+    async def set_level_curve(self, button, interaction):
+        cmd = bot.get_application_command("set_level_curve")
+        if cmd:
+            mention = f"</{cmd.name}:{cmd.id}>"
+            embed = discord.Embed(title="Set Level Curve", description=f"Choose how the XP required per level grows with the command {mention}.", color=discord.Color.blue())
+        else:
+            embed = discord.Embed(title="Set Level Curve", description="Choose how the XP required per level grows with the command ``/set_level_curve``.", color=discord.Color.blue())
+
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
     @discord.ui.button(label="Level Up Channel", style=discord.ButtonStyle.blurple)
     async def set_level_up_channel(self, button, interaction):
         cmd = bot.get_application_command("set_level_up_channel")
@@ -261,7 +391,7 @@ class VCChannel_Select(discord.ui.Select):
         channel = interaction.guild.get_channel(channel_id)
         if channel or channel_id == 0:
             await interaction.response.send_message(f"Selected channel: {channel.name}", ephemeral=True)
-            firebase_db.update(f"servers/{interaction.guild.id}/data/", {"create_vc": channel_id})
+            await guild_configs.update(interaction.guild.id, {"create_vc": channel_id})
 
 class VCSettingsView(discord.ui.View):
     def __init__(self, channels):
@@ -310,13 +440,7 @@ async def set_xp_per_message(ctx, xp: int):
         await ctx.respond("XP per message must be a positive integer.", ephemeral=True)
         return
 
-    server_path = f"servers/{ctx.guild.id}"
-    server_data = firebase_db.get(server_path)
-    if not server_data:
-        firebase_db.set(server_path, {"data": server_defaults, "users": {"_init": True}})
-        server_data = {"data": server_defaults}
-
-    firebase_db.update(f"{server_path}/data/levels", {"xp_per_message": xp})
+    await guild_configs.update(ctx.guild.id, {"xp_per_message": xp}, section="levels")
     await ctx.respond(f"XP per message has been set to {xp}.", ephemeral=True)
 
 @bot.slash_command(name="set_xp_cooldown", description="Set the cooldown time (in seconds) between messages that grant XP")
@@ -326,13 +450,7 @@ async def set_xp_cooldown(ctx, seconds: int):
         await ctx.respond("XP cooldown must be a non-negative integer.", ephemeral=True)
         return
 
-    server_path = f"servers/{ctx.guild.id}"
-    server_data = firebase_db.get(server_path)
-    if not server_data:
-        firebase_db.set(server_path, {"data": server_defaults, "users": {"_init": True}})
-        server_data = {"data": server_defaults}
-
-    firebase_db.update(f"{server_path}/data/levels", {"xp_cooldown": seconds})
+    await guild_configs.update(ctx.guild.id, {"xp_cooldown": seconds}, section="levels")
     await ctx.respond(f"XP cooldown has been set to {seconds} seconds.", ephemeral=True)
 
 @bot.slash_command(name="set_xp_per_level", description="Set the amount of XP required to level up")
@@ -342,37 +460,44 @@ async def set_xp_per_level(ctx, xp: int):
         await ctx.respond("XP per level must be a positive integer.", ephemeral=True)
         return
 
-    server_path = f"servers/{ctx.guild.id}"
-    server_data = firebase_db.get(server_path)
-    if not server_data:
-        firebase_db.set(server_path, {"data": server_defaults, "users": {"_init": True}})
-        server_data = {"data": server_defaults}
-
-    firebase_db.update(f"{server_path}/data/levels", {"xp_per_level": xp})
+    await guild_configs.update(ctx.guild.id, {"xp_per_level": xp}, section="levels")
     await ctx.respond(f"XP per level has been set to {xp}.", ephemeral=True)
 
+@bot.slash_command(name="set_level_curve", description="Set how the XP required per level grows")
+@commands.has_permissions(administrator=True)
+async def set_level_curve(
+    ctx,
+    curve: discord.Option(str, choices=list(levels.CURVES)),
+    factor: float = 1.5,
+    table: str = ""
+):
+    if curve == "exponential" and factor <= 1:
+        await ctx.respond("The factor of an exponential curve must be greater than 1.", ephemeral=True)
+        return
+
+    thresholds = []
+    if curve == "table":
+        try:
+            thresholds = [int(t.strip()) for t in table.split(",") if t.strip()]
+        except ValueError:
+            thresholds = []
+        if not thresholds or thresholds[0] <= 0 or any(b <= a for a, b in zip(thresholds, thresholds[1:])):
+            await ctx.respond("The table must be a comma separated list of increasing XP values, e.g. ``100,250,500``.", ephemeral=True)
+            return
+
+    await guild_configs.update(ctx.guild.id, {"curve": curve, "curve_factor": factor, "curve_table": thresholds}, section="levels")
+    await ctx.respond(f"Level curve has been set to {curve}.", ephemeral=True)
+
 @bot.slash_command(name="set_level_up_message", description="Set the message that is sent when a user levels up")
 @commands.has_permissions(administrator=True)
 async def set_level_up_message(ctx, *, message: str):
-    server_path = f"servers/{ctx.guild.id}"
-    server_data = firebase_db.get(server_path)
-    if not server_data:
-        firebase_db.set(server_path, {"data": server_defaults, "users": {"_init": True}})
-        server_data = {"data": server_defaults}
-
-    firebase_db.update(f"{server_path}/data/levels", {"level_up_message": message})
+    await guild_configs.update(ctx.guild.id, {"level_up_message": message}, section="levels")
     await ctx.respond("Level up message has been updated.", ephemeral=True)
 
 @bot.slash_command(name="set_level_up_channel", description="Set the channel where level up messages are sent")
 @commands.has_permissions(administrator=True)
 async def set_level_up_channel(ctx, channel: discord.TextChannel):
-    server_path = f"servers/{ctx.guild.id}"
-    server_data = firebase_db.get(server_path)
-    if not server_data:
-        firebase_db.set(server_path, {"data": server_defaults, "users": {"_init": True}})
-        server_data = {"data": server_defaults}
-
-    firebase_db.update(f"{server_path}/data/levels", {"level_up_channel": channel.id})
+    await guild_configs.update(ctx.guild.id, {"level_up_channel": channel.id}, section="levels")
     await ctx.respond(f"Level up messages will be sent in {channel.mention}.", ephemeral=True)
 
 @bot.slash_command(name="set_level_role", description="Assign a role to users when they reach a certain level")
@@ -382,24 +507,85 @@ async def set_level_role(ctx, level: int, role: discord.Role):
         await ctx.respond("Level must be a positive integer.", ephemeral=True)
         return
 
-    server_path = f"servers/{ctx.guild.id}"
-    server_data = firebase_db.get(server_path)
-    if not server_data:
-        firebase_db.set(server_path, {"data": server_defaults, "users": {"_init": True}})
-        server_data = {"data": server_defaults}
-
-    levels_config = server_data["data"].get("levels", {})
-    level_roles = levels_config.get("level_roles", {})
+    levels_config = (await guild_configs.get(ctx.guild.id)).levels
+    level_roles = dict(levels_config.level_roles)
     level_roles[str(level)] = role.id
-    firebase_db.update(f"{server_path}/data/levels", {"level_roles": level_roles})
+    await guild_configs.update(ctx.guild.id, {"level_roles": level_roles}, section="levels")
     await ctx.respond(f"Role {role.name} will be assigned to users when they reach level {level}.", ephemeral=True)
 
+LEADERBOARD_PAGE_SIZE = 10
+
+@bot.slash_command(name="leaderboard", description="Show the XP leaderboard of this server")
+async def leaderboard_command(ctx, page: int = 1):
+    await ctx.defer()
+    guild_id = ctx.guild.id
+    await leaderboard.ensure(guild_id, overrides=xp_ledger.cached_xp(guild_id))
+
+    total = leaderboard.size(guild_id)
+    pages = max(1, -(-total // LEADERBOARD_PAGE_SIZE))
+    page = min(max(page, 1), pages)
+    entries = leaderboard.page(guild_id, (page - 1) * LEADERBOARD_PAGE_SIZE, LEADERBOARD_PAGE_SIZE)
+
+    if not entries:
+        description = "Nobody has earned XP yet."
+    else:
+        curve = levels.curve_for((await guild_configs.get(guild_id)).levels)
+        description = "\n".join(
+            f"**{rank}.** <@{user_id}> - Level {curve.level_for_xp(xp)} ({xp} XP)"
+            for rank, user_id, xp in entries
+        )
+    embed = discord.Embed(title="Leaderboard", description=description, color=discord.Color.gold())
+    embed.set_footer(text=f"Page {page}/{pages}")
+    await ctx.respond(embed=embed)
+
+@bot.slash_command(name="rank", description="Show your rank or the rank of another member")
+async def rank(ctx, user: Optional[discord.Member] = None):
+    await ctx.defer()
+    user = user or ctx.author
+    guild_id = ctx.guild.id
+    await leaderboard.ensure(guild_id, overrides=xp_ledger.cached_xp(guild_id))
+
+    user_data = await xp_ledger.get_user(guild_id, user.id)
+    position = leaderboard.rank(guild_id, user.id)
+    curve = levels.curve_for((await guild_configs.get(guild_id)).levels)
+    next_level_xp = curve.xp_for_level(user_data.level + 1)
+
+    description = f"Rank: **#{position}** of {leaderboard.size(guild_id)}\n" if position else "Rank: unranked\n"
+    description += f"Level: **{user_data.level}**\nXP: **{user_data.xp}** / {next_level_xp}"
+    embed = discord.Embed(title=f"Rank of {user.display_name}", description=description, color=discord.Color.gold())
+    embed.set_thumbnail(url=user.display_avatar.url)
+    await ctx.respond(embed=embed)
+
+@bot.slash_command(name="reset_xp", description="Reset XP and levels of all members (Admin only)")
+@commands.has_permissions(administrator=True)
+async def reset_xp(ctx, confirm: bool):
+    await ctx.defer(ephemeral=True)
+    if confirm is not True:
+        await ctx.respond("You must confirm the reset by setting `confirm` to true.", ephemeral=True)
+        return
+    count = await xp_ledger.bulk_update(ctx.guild.id, lambda store: store.reset())
+    leaderboard.invalidate(ctx.guild.id)
+    await ctx.respond(f"XP and levels of {count} members have been reset.", ephemeral=True)
+
+@bot.slash_command(name="scale_xp", description="Multiply the XP of all members, e.g. 0.9 for decay (Admin only)")
+@commands.has_permissions(administrator=True)
+async def scale_xp(ctx, factor: float):
+    await ctx.defer(ephemeral=True)
+    if factor < 0:
+        await ctx.respond("The factor must not be negative.", ephemeral=True)
+        return
+    curve = levels.curve_for((await guild_configs.get(ctx.guild.id)).levels)
+    count = await xp_ledger.bulk_update(ctx.guild.id, lambda store: store.multiply(factor, curve))
+    leaderboard.invalidate(ctx.guild.id)
+    await ctx.respond(f"XP of {count} members has been multiplied by {factor}.", ephemeral=True)
+
 class TicketView(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)
     @discord.ui.button(label="Close Ticket", style=discord.ButtonStyle.red, custom_id="ticket:close")
     async def close_ticket(self, button, interaction):
         await interaction.response.send_message("Closing ticket...", ephemeral=True)
+        await ticket_store.close(interaction.guild.id, interaction.channel.id)
         await interaction.channel.delete()
 
 class SupportTicketView(discord.ui.View):
@@ -408,41 +594,58 @@ class SupportTicketView(discord.ui.View):
     @discord.ui.button(label="Create Ticket", style=discord.ButtonStyle.green, custom_id="ticket:create")
     async def create_ticket(self, button, interaction):
         await interaction.response.defer(ephemeral=True)
-        if not firebase_db.get(f"servers/{interaction.guild.id}/data/supporter_role"):
-            await interaction.response.send_message("Support tickets are not configured on this server.", ephemeral=True)
+        supporter_role_id = (await guild_configs.get(interaction.guild.id)).supporter_role
+        if not supporter_role_id:
+            await interaction.followup.send("Support tickets are not configured on this server.", ephemeral=True)
             return
-        supporter_role_id = firebase_db.get(f"servers/{interaction.guild.id}/data/supporter_role")
         supporter_role = interaction.guild.get_role(supporter_role_id)
         if not supporter_role:
             await interaction.followup.send("Supporter role not found. Please contact an administrator.", ephemeral=True)
             return
         channel = interaction.channel
         user = interaction.user
-        for thread in channel.threads:
-            if thread.name == f"ticket-{user.name}".lower():
-                await interaction.followup.send(f"You already have an open ticket in this channel: {thread.mention}", ephemeral=True)
+        if not ticket_store.claim(interaction.guild.id, user.id):
+            await interaction.followup.send("Your ticket is already being created.", ephemeral=True)
+            return
+        try:
+            thread = await find_open_ticket(interaction.guild, user.id)
+            if thread:
+                await interaction.followup.send(f"You already have an open ticket: {thread.mention}", ephemeral=True)
                 return
-            
-        ticket_thread = await channel.create_thread(name=f"ticket-{user.name}".lower(), type=discord.ChannelType.private_thread, invitable=False)
-        await ticket_thread.add_user(user)
-        for member in supporter_role.members:
-            await ticket_thread.add_user(member)
+
+            ticket_thread = await channel.create_thread(name=f"ticket-{user.name}".lower(), type=discord.ChannelType.private_thread, invitable=False)
+            await ticket_store.open(interaction.guild.id, user.id, ticket_thread.id, channel.id)
+            await ticket_thread.add_user(user)
+        finally:
+            ticket_store.release(interaction.guild.id, user.id)
         embed = discord.Embed(title="Support Ticket", description="A supporter will be with you shortly. To close this ticket, press the button below.", color=discord.Color.blue())
         view = TicketView()
         await ticket_thread.send(f"{user.mention}, your ticket has been created.\n{supporter_role.mention}", embed=embed, view=view)
         await interaction.followup.send(f"Your ticket has been created: {ticket_thread.mention}", ephemeral=True)
-        
+        # Supporter kommen im Hintergrund dazu, die Antwort wartet nicht auf sie
+        tickets.add_members(ticket_thread, [member for member in supporter_role.members if member.id != user.id], action_queue)
+
+async def find_open_ticket(guild, user_id):
+    """Offener Ticket-Thread des Users laut Index, auch wenn er archiviert ist."""
+    thread_id = await ticket_store.get_open(guild.id, user_id)
+    if thread_id is None:
+        return None
+    thread = guild.get_thread(thread_id)
+    if thread is None:
+        # archivierte Threads sind nicht im Cache
+        try:
+            thread = await bot.fetch_channel(thread_id)
+        except discord.NotFound:
+            # Thread wurde ohne "Close Ticket" gelöscht
+            await ticket_store.close(guild.id, thread_id)
+            return None
+    return thread
+
 @bot.slash_command(name="setup_support", description="Setup support tickets in the current channel")
 @commands.has_permissions(administrator=True)
 async def setup_support(ctx, supporter_role: discord.Role):
     await ctx.defer(ephemeral=True)
-    server_path = f"servers/{ctx.guild.id}"
-    server_data = firebase_db.get(server_path)
-    if not server_data:
-        firebase_db.set(server_path, {"data": server_defaults, "users": {"_init": True}})
-        server_data = {"data": server_defaults}
-
-    firebase_db.update(f"{server_path}/data", {"supporter_role": supporter_role.id})
+    await guild_configs.update(ctx.guild.id, {"supporter_role": supporter_role.id})
     embed = discord.Embed(title="Support Tickets", description="Click the button below to create a support ticket.", color=discord.Color.green())
     view = SupportTicketView()
     await ctx.channel.send(embed=embed, view=view)
@@ -455,10 +658,13 @@ async def delete_all_messages(ctx, confirm: bool, delete_pinned: bool = False):
     if confirm is not True:
         await ctx.respond("You must confirm the deletion by setting `confirm` to true.", ephemeral=True)
         return
-    def is_not_pinned(message):
-        return not message.pinned
-    deleted = await ctx.channel.purge(check=(is_not_pinned if not delete_pinned else None))
-    await ctx.respond(f"Deleted {len(deleted)} messages.", ephemeral=True)
+    if purge_manager.is_running(ctx.channel.id):
+        await ctx.respond("Messages in this channel are already being deleted.", ephemeral=True)
+        return
+    # alles vor dem Befehl löschen, die Statusnachricht bleibt stehen
+    status = await ctx.channel.send("🧹 Deleting messages...")
+    await purge_manager.start(ctx.channel, ctx.interaction.id, status, delete_pinned=delete_pinned)
+    await ctx.respond("Deleting messages in the background, progress is shown in this channel.", ephemeral=True)
 
 def build_bar(count: int, total: int) -> str:
     if total == 0:
@@ -469,153 +675,181 @@ def build_bar(count: int, total: int) -> str:
     return f"{bar} {int(percent * 100)}%"
 
 
-class PollSelect(discord.ui.Select):
-    def __init__(self, poll_id, options):
-        self.poll_id = poll_id
-        super().__init__(
-            placeholder="Vote for an option...",
-            options=[discord.SelectOption(label=opt, value=str(i)) for i, opt in enumerate(options)],
-            custom_id=f"poll:select:{poll_id}"
-        )
-
-    async def update_poll_message(self, interaction: discord.Interaction):
-        guild_id = str(interaction.guild.id)
-        if not self.poll_id:
-            self.poll_id = interaction.message.embeds[0].footer.text.split('|')[1].strip()
-        print(self.poll_id, flush=True)
-        poll_data = firebase_db.get(f"servers/{guild_id}/polls/{self.poll_id}")
-        if not poll_data:
-            return
-
-        options = poll_data.get("options", [])
-        votes = poll_data.get("votes", {})
-        total_votes = len(votes)
-        question = poll_data.get("question", "Poll")
-
-        desc = ""
-        for i, opt in enumerate(options):
-            count = sum(1 for v in votes.values() if v == i)
-            desc += f"{i+1}. {opt}: `{build_bar(count, total_votes)}`\n"
-
-        embed = discord.Embed(
-            title=f"Anonymous Poll: {question}",
-            description=desc,
-            color=discord.Color.blue()
-        )
-        embed.set_footer(text=f"Votes: {total_votes} | {self.poll_id}")
-        await interaction.message.edit(embed=embed, view=self.view)
+def build_poll_results(options: list, counts: list) -> str:
+    total_votes = sum(counts)
+    desc = ""
+    for i, opt in enumerate(options):
+        desc += f"{i+1}. {opt}: `{build_bar(counts[i], total_votes)}`\n"
+    return desc
 
-    async def callback(self, interaction: discord.Interaction):
-        guild_id = str(interaction.guild.id)
-        user_id = str(interaction.user.id)
 
-        if not self.poll_id:
-            self.poll_id = interaction.message.embeds[0].footer.text.split('|')[1].strip()
+async def render_poll_embed(guild_id, poll_id):
+    meta = await poll_store.get_meta(guild_id, poll_id)
+    if not meta:
+        return None
 
-        poll_data = firebase_db.get(f"servers/{guild_id}/polls/{self.poll_id}")
-        if not poll_data:
-            await interaction.response.send_message("Poll not found.", ephemeral=True)
-            return
+    options = meta["options"]
+    counts = await poll_store.get_counts(guild_id, poll_id, len(options))
 
-        votes = poll_data.get("votes", {})
-        votes[user_id] = int(self.values[0])
-        firebase_db.update(f"servers/{guild_id}/polls/{self.poll_id}", {"votes": votes})
+    title = f"Anonymous Poll: {meta['question']}"
+    if not poll_store.is_open(meta):
+        title += " (closed)"
+    embed = discord.Embed(
+        title=title,
+        description=build_poll_results(options, counts),
+        color=discord.Color.blue()
+    )
+    embed.set_footer(text=f"Votes: {sum(counts)} | {poll_id}")
+    return embed
 
-        await self.update_poll_message(interaction)
-        await interaction.response.send_message("Your vote has been recorded.", ephemeral=True)
+poll_refresher = polls.PollRefresher(render_poll_embed, window=float(os.getenv('POLL_REFRESH_WINDOW', 2)))
+metrics.registry.register(metrics.Gauge("tigerbot_poll_edits", "Poll message edits sent", lambda: poll_refresher.edits))
+metrics.registry.register(metrics.Gauge("tigerbot_poll_edits_saved", "Poll message edits saved by coalescing", lambda: poll_refresher.saved))
 
 
 class PollView(discord.ui.View):
+    """
+    Nur das Layout einer Poll-Nachricht. Klicks werden nicht über die View,
+    sondern zentral in handle_poll_interaction anhand der custom_id behandelt,
+    dadurch muss beim Start keine View pro Poll registriert werden.
+    """
+
     def __init__(self, poll_id, options):
         super().__init__(timeout=None)
-        self.add_item(PollSelect(poll_id, options))
-        self.poll_id = poll_id
-
-    @discord.ui.button(label="Show my vote", style=discord.ButtonStyle.blurple, custom_id="poll:showvote")
-    async def show_vote(self, button, interaction: discord.Interaction):
-        guild_id = str(interaction.guild.id)
-        user_id = str(interaction.user.id)
-
-        if not self.poll_id:
-            self.poll_id = interaction.message.embeds[0].footer.text.split('|')[1].strip()
+        self.add_item(discord.ui.Select(
+            placeholder="Vote for an option...",
+            options=[discord.SelectOption(label=opt, value=str(i)) for i, opt in enumerate(options)],
+            custom_id=f"poll:select:{poll_id}"
+        ))
+        self.add_item(discord.ui.Button(label="Show my vote", style=discord.ButtonStyle.blurple, custom_id=f"poll:showvote:{poll_id}"))
+        self.add_item(discord.ui.Button(label="Remove my vote", style=discord.ButtonStyle.red, custom_id=f"poll:removevote:{poll_id}"))
 
-        poll_data = firebase_db.get(f"servers/{guild_id}/polls/{self.poll_id}")
-        if not poll_data:
-            await interaction.response.send_message("Poll not found.", ephemeral=True)
-            return
 
-        votes = poll_data.get("votes", {})
-        options = poll_data.get("options", [])
+async def handle_poll_interaction(interaction: discord.Interaction, custom_id: str):
+    parts = custom_id.split(":")
+    action = parts[1]
+    if len(parts) > 2:
+        poll_id = parts[2]
+    else:
+        # alte Poll-Nachrichten haben die ID nur im Footer
+        poll_id = interaction.message.embeds[0].footer.text.split('|')[1].strip()
+    guild_id = str(interaction.guild.id)
+    user_id = str(interaction.user.id)
+
+    meta = await poll_store.get_meta(guild_id, poll_id)
+    if not meta:
+        await interaction.response.send_message("Poll not found.", ephemeral=True)
+        return
+    options = meta["options"]
 
-        if user_id not in votes:
+    if action == "showvote":
+        choice_index = await poll_store.get_vote(guild_id, poll_id, user_id)
+        if choice_index is None:
             embed = discord.Embed(title="Your vote", description="You haven't voted yet.", color=discord.Color.red())
         else:
-            choice_index = votes[user_id]
-            total_votes = len(votes)
+            counts = await poll_store.get_counts(guild_id, poll_id, len(options))
             description = f"You voted for: **{options[choice_index]}**\n\n"
-            for i, opt in enumerate(options):
-                count = sum(1 for v in votes.values() if v == i)
-                description += f"{i+1}. {opt}: `{build_bar(count, total_votes)}`\n"
+            description += build_poll_results(options, counts)
             embed = discord.Embed(title="Your vote", description=description, color=discord.Color.green())
-
         await interaction.response.send_message(embed=embed, ephemeral=True)
+        return
+
+    if not poll_store.is_open(meta):
+        await interaction.response.send_message("This poll is closed.", ephemeral=True)
+        if not meta["closed"]:
+            # abgelaufen -> Nachricht einmalig abschließen
+            await close_poll_message(guild_id, poll_id, interaction.message)
+        return
+
+    if action == "select":
+        await poll_store.cast_vote(guild_id, poll_id, user_id, int(interaction.data["values"][0]), len(options))
+        await interaction.response.send_message("Your vote has been recorded.", ephemeral=True)
+    elif action == "removevote":
+        removed = await poll_store.remove_vote(guild_id, poll_id, user_id, len(options))
+        if removed is None:
+            await interaction.response.send_message("You haven't voted yet.", ephemeral=True)
+            return
+        await interaction.response.send_message("Your vote has been removed.", ephemeral=True)
+    else:
+        return
+
+    # Edits werden gesammelt und gebündelt ausgeführt
+    poll_refresher.request(guild_id, poll_id, interaction.message)
+
 
-    @discord.ui.button(label="Remove my vote", style=discord.ButtonStyle.red, custom_id="poll:removevote")
-    async def remove_vote(self, button, interaction: discord.Interaction):
-        guild_id = str(interaction.guild.id)
-        user_id = str(interaction.user.id)
+async def close_poll_message(guild_id, poll_id, message=None):
+    """Markiert die Poll als geschlossen und ersetzt die Nachricht durch das Endergebnis."""
+    await poll_store.close(guild_id, poll_id)
+    meta = await poll_store.get_meta(guild_id, poll_id)
+    if message is None and meta and meta["channel_id"]:
+        channel = bot.get_channel(meta["channel_id"])
+        if channel:
+            try:
+                message = await channel.fetch_message(meta["message_id"])
+            except discord.NotFound:
+                message = None
+    if message is None:
+        return False
 
-        if not self.poll_id:
-            self.poll_id = interaction.message.embeds[0].footer.text.split('|')[1].strip()
+    embed = await render_poll_embed(guild_id, poll_id)
+    await message.edit(embed=embed, view=None)
+    return True
 
-        poll_data = firebase_db.get(f"servers/{guild_id}/polls/{self.poll_id}")
-        if not poll_data:
-            await interaction.response.send_message("Poll not found.", ephemeral=True)
+
+@bot.event
+@metrics.timed("on_interaction")
+async def on_interaction(interaction: discord.Interaction):
+    if interaction.type == discord.InteractionType.component:
+        custom_id = (interaction.data or {}).get("custom_id", "")
+        if custom_id.startswith("poll:"):
+            await handle_poll_interaction(interaction, custom_id)
             return
+    await bot.process_application_commands(interaction)
 
-        votes = poll_data.get("votes", {})
-        if user_id in votes:
-            del votes[user_id]
-            firebase_db.update(f"servers/{guild_id}/polls/{self.poll_id}", {"votes": votes})
-            await self.children[2].update_poll_message(interaction)  # <-- PollSelect
-            await interaction.response.send_message("Your vote has been removed.", ephemeral=True)
-        else:
-            await interaction.response.send_message("You haven't voted yet.", ephemeral=True)
 
 @bot.slash_command(name="create_poll", description="Create an anonymous poll")
 @commands.has_permissions(manage_messages=True) 
-async def create_poll(ctx, question: str, options: str):
+async def create_poll(ctx, question: str, options: str, duration_minutes: int = 0):
     await ctx.defer(ephemeral=True)
     options_list = [opt.strip() for opt in options.split(",") if opt.strip()]
     if len(options_list) < 2 or len(options_list) > 10:
         await ctx.respond("You must provide between 2 and 10 options, separated by commas.", ephemeral=True)
         return
+    if duration_minutes < 0:
+        await ctx.respond("Duration must be a non-negative integer.", ephemeral=True)
+        return
 
     poll_id = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
     guild_id = str(ctx.guild.id)
+    expires_at = int(time.time()) + duration_minutes * 60 if duration_minutes else 0
 
-    firebase_db.update(f"servers/{guild_id}/polls", {
-        poll_id: {
-            "question": question,
-            "options": options_list,
-            "votes": {}
-        }
-    })
-
-    desc = ""
-    for i, opt in enumerate(options_list):
-        desc += f"{i+1}. {opt}: `---------- 0%`\n"
+    await poll_store.create(guild_id, poll_id, question, options_list, expires_at)
 
     embed = discord.Embed(
         title=f"Anonymous Poll: {question}",
-        description=desc,
+        description=build_poll_results(options_list, [0] * len(options_list)),
         color=discord.Color.blue()
     )
     embed.set_footer(text=f"Votes: 0 | {poll_id}")
     view = PollView(poll_id, options_list)
-    await ctx.channel.send(embed=embed, view=view)
+    message = await ctx.channel.send(embed=embed, view=view)
+    # View wieder abmelden, Klicks landen in on_interaction
+    view.stop()
+    await poll_store.set_message(guild_id, poll_id, ctx.channel.id, message.id)
     await ctx.respond("Poll has been created.", ephemeral=True)
 
+@bot.slash_command(name="close_poll", description="Close a poll and show the final results")
+@commands.has_permissions(manage_messages=True)
+async def close_poll(ctx, poll_id: str):
+    await ctx.defer(ephemeral=True)
+    if not await poll_store.get_meta(ctx.guild.id, poll_id):
+        await ctx.respond("Poll not found.", ephemeral=True)
+        return
+    if await close_poll_message(str(ctx.guild.id), poll_id):
+        await ctx.respond("Poll has been closed.", ephemeral=True)
+    else:
+        await ctx.respond("Poll has been closed, but its message could not be found.", ephemeral=True)
+
 class AcceptRulesView(discord.ui.View):
     def __init__(self):
         super().__init__(timeout=None)
@@ -645,6 +879,8 @@ async def rules(
     except_of: str = ""
 ):
     guild = ctx.guild
+    # Der Blind-Modus kann bei großen Servern länger als 3 Sekunden dauern
+    await ctx.defer(ephemeral=True)
 
     embed = discord.Embed(
         title="📜 Serverregeln",
@@ -662,7 +898,7 @@ async def rules(
     # Wenn blind aktiviert ist, verstecke alles außer den Regelkanal
     if blind:
         except_channels = [ec.strip() for ec in except_of.split(",")]
-        blind_excepts = []
+        blind_excepts = set()
         for e_c in except_channels:
             if e_c.startswith("<#") and e_c.endswith(">"):
                 channel_id = int(e_c[2:-1])
@@ -671,26 +907,42 @@ async def rules(
                 exc_channel = discord.utils.get(ctx.guild.channels, name=e_c)
 
             if exc_channel:
-                blind_excepts.append(exc_channel)
-
-        print(blind_excepts, flush=True)
+                blind_excepts.add(exc_channel.id)
 
         rules_channel = ctx.channel
 
-        # Regelkanal bleibt sichtbar
-        await rules_channel.set_permissions(guild.default_role, view_channel=True, send_messages=False)
-        await rules_channel.set_permissions(role, view_channel=True)
-
-        # Alle anderen Kanäle verstecken
+        # Regelkanal bleibt sichtbar, alle anderen Kanäle werden versteckt
+        changes = {rules_channel.id: {
+            guild.default_role: {"view_channel": True, "send_messages": False},
+            role: {"view_channel": True}
+        }}
         for channel in guild.channels:
-            if channel.id != rules_channel.id and not channel.id in [exc.id for exc in blind_excepts]:
-                await channel.set_permissions(guild.default_role, view_channel=False)
-                await channel.set_permissions(role, view_channel=True)
-
-        await ctx.respond(
-            "🔒 'Blind'-Modus aktiviert: Nur verifizierte User können andere Kanäle sehen.",
-            ephemeral=True
-        )
+            if channel.id != rules_channel.id and channel.id not in blind_excepts:
+                changes[channel.id] = {guild.default_role: {"view_channel": False}, role: {"view_channel": True}}
+
+        channels = [rules_channel] + [channel for channel in guild.channels if channel.id != rules_channel.id]
+        plan = permissions.plan_overwrites(channels, changes)
+        status = await ctx.followup.send(f"🔒 Updating permissions: 0/{len(plan)}", ephemeral=True, wait=True)
+
+        def show(text):
+            async def edit_status():
+                try:
+                    await status.edit(content=text)
+                except discord.HTTPException:
+                    # Interaction-Token abgelaufen, die Änderungen laufen trotzdem weiter
+                    pass
+            # Antworten auf die Interaction vor den Overwrites, nur der neueste Stand wird gesendet
+            return action_queue.submit(f"interaction:{ctx.interaction.id}", edit_status,
+                                       priority=actions.INTERACTION, key=("interaction", ctx.interaction.id))
+
+        async def report(done, total):
+            show(f"🔒 Updating permissions: {done}/{total}")
+
+        failed = await permissions.apply_overwrites(plan, action_queue, progress=report, reason="Rules blind mode")
+        text = f"🔒 'Blind'-Modus aktiviert: Nur verifizierte User können andere Kanäle sehen. ({len(plan)} overwrites updated)"
+        if failed:
+            text += f"\n⚠️ Failed for: {', '.join(channel.mention for channel in failed)}"
+        show(text)
     else:
         await ctx.respond(
             "📜 Regeln wurden gesendet (ohne Blind-Modus).",
@@ -715,46 +967,65 @@ async def imitate(
     title: str = ""
 ):
     await ctx.respond("Creating Imitation...", ephemeral=True)
+    channel = ctx.channel
 
-    webhook = await ctx.channel.create_webhook(
-        name=user.display_name,
-        avatar=await user.display_avatar.read()
-    )
-
-    try:
+    async def send_imitation():
         if embed:
             msg_embed = discord.Embed(
                 title=title or None,
                 description=text,
                 color=discord.Color.random()
             )
-            await webhook.send(embed=msg_embed)
+            await webhook_pool.send(channel, user.display_name, user.display_avatar.url, embed=msg_embed)
         else:
-            await webhook.send(text)
-    finally:
-        await webhook.delete()
-
-from flask import Flask
-import threading
-
-# Flask App
-app = Flask(__name__)
-
-@app.route("/")
-def home():
-    return "Bot is running!", 200
-
-
-def run_discord():
+            await webhook_pool.send(channel, user.display_name, user.display_avatar.url, content=text)
+
+    action_queue.submit(f"channel:{channel.id}:webhooks", send_imitation)
+
+def guild_stats(guild_id: int):
+    """Statistiken einer Guild für /stats/{guild_id}, nur aus dem Arbeitsspeicher."""
+    guild = bot.get_guild(guild_id)
+    if guild is None:
+        return None
+    stats = {
+        "id": guild.id,
+        "name": guild.name,
+        "members": guild.member_count,
+        "config_cached": str(guild_id) in guild_configs.configs,
+        "cached_users": len(xp_ledger.users.get(str(guild_id), ())),
+        "pending_xp_writes": len(xp_ledger.dirty.get(str(guild_id), ())),
+    }
+    if leaderboard.is_loaded(guild_id):
+        stats["ranked_users"] = leaderboard.size(guild_id)
+        stats["top"] = [{"rank": rank, "user_id": str(user_id), "xp": user_xp} for rank, user_id, user_xp in leaderboard.page(guild_id, 0, 10)]
+    return stats
+
+
+async def main_async():
     if not TOKEN:
         raise ValueError("BOT_TOKEN not found in environment!")
-    bot.run(TOKEN)
+    if snapshot_store is not None:
+        # sofort mit dem letzten Stand starten, Abgleich mit der Datenbank läuft nebenher
+        data = await asyncio.to_thread(snapshot_store.load)
+        if data is not None:
+            snapshot.restore(data, guild_configs, xp_ledger, poll_store)
+            bot.reconcile_task = asyncio.create_task(snapshot.reconcile(
+                db, data, guild_configs, xp_ledger, poll_store, concurrency=int(os.getenv('DB_INIT_CONCURRENCY', 5))
+            ))
+        bot.snapshot_task = asyncio.create_task(snapshot.run_periodically(
+            snapshot_store, float(os.getenv('SNAPSHOT_INTERVAL', 300)), guild_configs, xp_ledger, poll_store
+        ))
+    # Webserver und Bot teilen sich denselben Event-Loop
+    runner = await webserver.start(webserver.create_app(bot, db, guild_stats), port=int(os.getenv("PORT", 10000)))
+    try:
+        async with bot:
+            await bot.start(TOKEN)
+    finally:
+        await runner.cleanup()
 
 
 if __name__ == '__main__':
-    # Discord-Bot in einem zweiten Thread starten
-    bot_thread = threading.Thread(target=run_discord, daemon=True)
-    bot_thread.start()
-
-    # Flask läuft im Main Thread
-    app.run(host="0.0.0.0", port=os.getenv("PORT", 10000))
+    try:
+        asyncio.run(main_async())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,211 @@
+"""
+Minimale Prometheus-Metriken ohne zusätzliche Abhängigkeit.
+Alle Metriken sind threadsicher (z.B. für Aufrufe aus dem Thread-Pool);
+`registry.render()` liefert das Textformat für /metrics.
+"""
+import asyncio
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    """Wert wird beim Rendern über `fn()` gelesen (oder per `set` gesetzt)."""
+
+    def __init__(self, name: str, documentation: str, fn=None):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self) -> list:
+        try:
+            value = self.fn() if self.fn is not None else self.value
+        except Exception:
+            value = float("nan")
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket_counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+event_latency = registry.register(Histogram(
+    "tigerbot_event_seconds", "Latency of gateway event handlers", ("event",)))
+command_latency = registry.register(Histogram(
+    "tigerbot_command_seconds", "Latency of slash commands", ("command", "status")))
+db_latency = registry.register(Histogram(
+    "tigerbot_db_seconds", "Latency of storage calls", ("op", "prefix")))
+db_errors = registry.register(Counter(
+    "tigerbot_db_errors_total", "Failed storage calls", ("op", "prefix")))
+rate_limits = registry.register(Counter(
+    "tigerbot_discord_rate_limits_total", "Discord REST 429 responses", ("scope",)))
+lock_acquired = registry.register(Counter(
+    "tigerbot_lock_acquisitions_total", "Acquisitions of per-key locks", ("lock",)))
+lock_contended = registry.register(Counter(
+    "tigerbot_lock_contended_total", "Acquisitions of per-key locks that had to wait", ("lock",)))
+lock_wait = registry.register(Histogram(
+    "tigerbot_lock_wait_seconds", "Time spent waiting for a contended per-key lock", ("lock",)))
+loop_lag = registry.register(Histogram(
+    "tigerbot_event_loop_lag_seconds", "Delay of the event loop beyond the expected wakeup",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)))
+
+
+def timed(event: str):
+    """Decorator für Event-Handler: misst die Laufzeit unter `event`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                event_latency.observe(time.perf_counter() - started, event)
+        return wrapper
+    return decorator
+
+
+def path_prefix(path: str, depth: int = 3) -> str:
+    """`servers/123/users/456` -> `servers/*/users`, damit die Label-Anzahl klein bleibt."""
+    keys = [key for key in path.strip("/").split("/") if key][:depth]
+    return "/".join("*" if key.isdigit() else key for key in keys) or "/"
+
+
+class InstrumentedBackend:
+    """Wrapper um ein Storage-Backend, misst Anzahl und Dauer der Aufrufe."""
+
+    OPERATIONS = ("get", "query", "set", "update", "delete", "increment", "transaction")
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        method = getattr(self.backend, name)
+        if name not in self.OPERATIONS:
+            return method
+
+        async def instrumented(path, *args, **kwargs):
+            prefix = path_prefix(path)
+            started = time.perf_counter()
+            try:
+                return await method(path, *args, **kwargs)
+            except Exception:
+                db_errors.inc(name, prefix)
+                raise
+            finally:
+                db_latency.observe(time.perf_counter() - started, name, prefix)
+
+        return instrumented
+
+
+class RateLimitHandler(logging.Handler):
+    """
+    Zählt die Warnungen, die discord.http bei einem 429 loggt: `route` für
+    jeden 429, `global` zusätzlich, wenn es das globale Limit war.
+    """
+
+    def emit(self, record):
+        message = record.getMessage()
+        if message.startswith("We are being rate limited"):
+            rate_limits.inc("route")
+        elif message.startswith("Global rate limit has been hit"):
+            rate_limits.inc("global")
+
+
+def install_rate_limit_counter():
+    logging.getLogger("discord.http").addHandler(RateLimitHandler(logging.WARNING))
+
+
+async def watch_loop_lag(interval: float = 0.5):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(0.0, time.perf_counter() - started - interval))
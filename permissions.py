@@ -0,0 +1,82 @@
+"""
+Massenänderungen an Kanal-Overwrites (z.B. der Blind-Modus von /rules).
+Es wird vorher berechnet, welche Overwrites sich wirklich ändern, und nur
+diese werden gesetzt; die Requests laufen über die ActionQueue (actions.py).
+"""
+import asyncio
+
+import discord
+
+
+def merged_overwrite(current: discord.PermissionOverwrite, values: dict):
+    """`current` mit `values` überschrieben, oder None, wenn sich nichts ändert."""
+    if all(getattr(current, name) == value for name, value in values.items()):
+        return None
+    allow, deny = current.pair()
+    overwrite = discord.PermissionOverwrite.from_pair(allow, deny)
+    overwrite.update(**values)
+    return overwrite
+
+
+def plan_overwrites(channels, changes: dict) -> list:
+    """
+    `changes` ist {kanal_id: {ziel: {permission: wert}}}. Liefert eine Liste
+    (kanal, ziel, neuer Overwrite) nur für Overwrites, die noch nicht stimmen.
+    Kanäle, die schon passen (z.B. nach einem früheren Lauf), kosten keinen Request.
+    """
+    plan = []
+    for channel in channels:
+        for target, values in changes.get(channel.id, {}).items():
+            # overwrites_for liest die Rohdaten, auch für nicht gecachte Member
+            overwrite = merged_overwrite(channel.overwrites_for(target), values)
+            if overwrite is not None:
+                plan.append((channel, target, overwrite))
+    return plan
+
+
+async def apply_overwrites(plan: list, queue, progress=None, progress_interval: float = 2.0, reason: str = None):
+    """
+    Setzt die Overwrites aus `plan` über die ActionQueue (ein Bucket pro
+    Kanal, Overwrites eines Kanals nacheinander). `progress(done, total)`
+    wird höchstens alle `progress_interval` Sekunden aufgerufen.
+    Rückgabe: Liste der Kanäle, bei denen es Fehler gab.
+    """
+    by_channel = {}
+    for channel, target, overwrite in plan:
+        by_channel.setdefault(channel, []).append((target, overwrite))
+
+    def update(channel, entries):
+        async def run():
+            for target, overwrite in entries:
+                await channel.set_permissions(target, overwrite=overwrite, reason=reason)
+        return run
+
+    futures = {
+        queue.submit(f"channel:{channel.id}", update(channel, entries), key=("overwrites", channel.id)): channel
+        for channel, entries in by_channel.items()
+    }
+    total = len(plan)
+    done = 0
+
+    def count(future, entries):
+        nonlocal done
+        done += entries
+
+    for future, channel in futures.items():
+        future.add_done_callback(lambda f, n=len(by_channel[channel]): count(f, n))
+
+    waiting = set(futures)
+    while waiting:
+        _, waiting = await asyncio.wait(waiting, timeout=progress_interval)
+        if progress is not None and waiting:
+            await progress(done, total)
+
+    failed = []
+    for future, channel in futures.items():
+        if future.cancelled():
+            # Queue wurde beim Beenden geleert
+            failed.append(channel)
+        elif future.exception() is not None:
+            print(f"Could not update permissions of {channel.name}: {future.exception()}", flush=True)
+            failed.append(channel)
+    return failed
@@ -0,0 +1,209 @@
+import asyncio
+import time
+from collections import OrderedDict
+from atomic import KeyedLocks
+from storage import increment_value
+
+
+def counts_list(raw, option_count: int) -> list:
+    """`counts` kommt je nach Inhalt als Liste oder dict ("0" -> n) zurück."""
+    counts = [0] * option_count
+    if isinstance(raw, list):
+        items = enumerate(raw)
+    elif isinstance(raw, dict):
+        items = ((int(k), v) for k, v in raw.items() if str(k).isdigit())
+    else:
+        items = ()
+    for i, value in items:
+        if 0 <= i < option_count and value:
+            counts[i] = int(value)
+    return counts
+
+
+class PollStore:
+    """
+    Speichert Stimmen einzeln unter `polls/{id}/votes/{user}` und pflegt
+    pro Option einen Zähler unter `polls/{id}/counts/{i}`. Abstimmen und
+    Anzeigen kosten damit unabhängig von der Anzahl der Stimmen O(1).
+    """
+
+    def __init__(self, db, max_cached: int = 1024):
+        self.db = db
+        self.max_cached = max_cached
+        self.meta = OrderedDict()  # (guild_id, poll_id) -> {"question", "options", "closed", "expires_at", ...}
+        self.counted = set()  # Polls, bei denen `counts` sicher existiert
+        self._migrating = KeyedLocks("poll_counts")
+        self._voting = KeyedLocks("poll_vote")
+
+    def _path(self, guild_id, poll_id) -> str:
+        return f"servers/{guild_id}/polls/{poll_id}"
+
+    def _cache(self, key, meta):
+        self.meta[key] = meta
+        self.meta.move_to_end(key)
+        while len(self.meta) > self.max_cached:
+            old_key, _ = self.meta.popitem(last=False)
+            self.counted.discard(old_key)
+        return meta
+
+    async def create(self, guild_id, poll_id, question: str, options: list, expires_at: int = 0):
+        await self.db.set(self._path(guild_id, poll_id), {
+            "question": question,
+            "options": options,
+            "counts": [0] * len(options),
+            "expires_at": expires_at
+        })
+        key = (str(guild_id), str(poll_id))
+        self._cache(key, {"question": question, "options": options, "closed": False, "expires_at": expires_at,
+                          "channel_id": 0, "message_id": 0})
+        self.counted.add(key)
+
+    async def set_message(self, guild_id, poll_id, channel_id: int, message_id: int):
+        """Merkt sich, wo die Poll-Nachricht steht (zum Schließen)."""
+        await self.db.update(self._path(guild_id, poll_id), {"channel_id": channel_id, "message_id": message_id})
+        meta = self.meta.get((str(guild_id), str(poll_id)))
+        if meta is not None:
+            meta["channel_id"] = channel_id
+            meta["message_id"] = message_id
+
+    async def get_meta(self, guild_id, poll_id):
+        key = (str(guild_id), str(poll_id))
+        meta = self.meta.get(key)
+        if meta is not None:
+            self.meta.move_to_end(key)
+            return meta
+
+        # nur die kleinen Felder lesen, nicht die ganze Stimmen-Map
+        path = self._path(guild_id, poll_id)
+        fields = ("question", "options", "closed", "expires_at", "channel_id", "message_id")
+        values = await asyncio.gather(*(self.db.get(f"{path}/{field}") for field in fields))
+        data = dict(zip(fields, values))
+        if data["options"] is None:
+            return None
+        return self._cache(key, {
+            "question": data["question"] or "Poll",
+            "options": data["options"],
+            "closed": bool(data["closed"]),
+            "expires_at": data["expires_at"] or 0,
+            "channel_id": data["channel_id"] or 0,
+            "message_id": data["message_id"] or 0
+        })
+
+    def restore(self, guild_id, poll_id, meta: dict):
+        """Übernimmt Metadaten aus dem lokalen Snapshot (siehe snapshot.py)."""
+        key = (str(guild_id), str(poll_id))
+        if key not in self.meta:
+            self._cache(key, meta)
+
+    def is_open(self, meta: dict, now: int = None) -> bool:
+        now = int(time.time()) if now is None else now
+        return not meta["closed"] and not (meta["expires_at"] and now >= meta["expires_at"])
+
+    async def close(self, guild_id, poll_id):
+        await self.db.update(self._path(guild_id, poll_id), {"closed": True})
+        meta = self.meta.get((str(guild_id), str(poll_id)))
+        if meta is not None:
+            meta["closed"] = True
+
+    async def _ensure_counts(self, guild_id, poll_id, option_count: int):
+        """Alte Polls ohne Zähler einmalig aus der Stimmen-Map nachzählen."""
+        key = (str(guild_id), str(poll_id))
+        if key in self.counted:
+            return
+        # die ersten Stimmen nach einem Neustart prüfen nur einmal pro Poll
+        async with self._migrating.hold(key):
+            if key in self.counted:
+                return
+            path = self._path(guild_id, poll_id)
+            if await self.db.get(f"{path}/counts") is None:
+                votes = await self.db.get(f"{path}/votes") or {}
+                counts = [0] * option_count
+                for choice in votes.values():
+                    if isinstance(choice, int) and 0 <= choice < option_count:
+                        counts[choice] += 1
+                # nur schreiben, wenn zwischenzeitlich niemand anderes migriert hat
+                await self.db.transaction(f"{path}/counts", lambda current: counts if current is None else current)
+            self.counted.add(key)
+
+    async def get_counts(self, guild_id, poll_id, option_count: int) -> list:
+        await self._ensure_counts(guild_id, poll_id, option_count)
+        raw = await self.db.get(f"{self._path(guild_id, poll_id)}/counts")
+        return counts_list(raw, option_count)
+
+    async def get_vote(self, guild_id, poll_id, user_id):
+        return await self.db.get(f"{self._path(guild_id, poll_id)}/votes/{user_id}")
+
+    async def _swap_vote(self, guild_id, poll_id, user_id, choice, option_count: int):
+        await self._ensure_counts(guild_id, poll_id, option_count)
+        path = self._path(guild_id, poll_id)
+        # Klicks desselben Users nacheinander: lokal gibt es so keine ETag-Konflikte,
+        # die Transaktion schützt nur noch gegen andere Prozesse
+        async with self._voting.hold((str(guild_id), str(poll_id), str(user_id))):
+            old, _ = await self.db.transaction(f"{path}/votes/{user_id}", lambda current: choice)
+            if old == choice:
+                return old
+            # Zähler als Server-Inkrement, damit Stimmen verschiedener User sich nicht überschreiben
+            updates = {}
+            if choice is not None:
+                updates[f"counts/{choice}"] = increment_value(1)
+            if old is not None:
+                updates[f"counts/{old}"] = increment_value(-1)
+            await self.db.update(path, updates)
+        return old
+
+    async def cast_vote(self, guild_id, poll_id, user_id, choice: int, option_count: int):
+        """Gibt die vorherige Stimme des Users zurück (oder None)."""
+        return await self._swap_vote(guild_id, poll_id, user_id, choice, option_count)
+
+    async def remove_vote(self, guild_id, poll_id, user_id, option_count: int):
+        """Gibt die entfernte Stimme zurück (oder None, wenn es keine gab)."""
+        return await self._swap_vote(guild_id, poll_id, user_id, None, option_count)
+
+
+class PollRefresher:
+    """
+    Fasst Aktualisierungen einer Poll-Nachricht zusammen: alle Stimmen, die
+    innerhalb von `window` Sekunden eintreffen, führen zu genau einem
+    `message.edit`, gerendert wird immer der neueste Stand.
+    """
+
+    def __init__(self, render, window: float = 2.0):
+        self.render = render  # async (guild_id, poll_id) -> discord.Embed | None
+        self.window = window
+        self.pending = {}  # (guild_id, poll_id) -> message
+        self.tasks = set()  # laufende Refreshes, damit sie nicht vom GC eingesammelt werden
+        self.requested = 0
+        self.edits = 0
+        self.saved = 0  # Edits, die durch das Zusammenfassen gespart wurden
+
+    def request(self, guild_id, poll_id, message):
+        self.requested += 1
+        key = (str(guild_id), str(poll_id))
+        if key in self.pending:
+            # Edit ist schon geplant, nur die Nachricht aktualisieren
+            self.pending[key] = message
+            self.saved += 1
+            return
+        self.pending[key] = message
+        task = asyncio.create_task(self._refresh(key))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _refresh(self, key):
+        await asyncio.sleep(self.window)
+        message = self.pending.pop(key, None)
+        if message is None:
+            return
+        try:
+            embed = await self.render(*key)
+            if embed is not None:
+                await message.edit(embed=embed)
+                self.edits += 1
+        except Exception as e:
+            print(f"Poll refresh for {key[1]} failed: {e}", flush=True)
+
+    async def stop(self):
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.pending.clear()
@@ -0,0 +1,135 @@
+"""
+Löschen des Verlaufs eines Kanals als Hintergrund-Job.
+
+Der Verlauf wird seitenweise (neueste zuerst) gelesen. Nachrichten, die
+jünger als 14 Tage sind, werden per Bulk-Delete gelöscht (bis zu 100 pro
+Request), ältere einzeln mit Pause dazwischen. Nach jeder Seite wird ein
+Checkpoint unter `purge_jobs/{channel}` gespeichert, nach einem Neustart
+macht `resume` dort weiter.
+"""
+import asyncio
+import time
+
+import discord
+
+
+# Bulk-Delete akzeptiert nur Nachrichten bis 14 Tage, mit etwas Abstand
+BULK_MAX_AGE = 14 * 24 * 60 * 60 - 10 * 60
+
+
+def bulk_cutoff(now: float = None) -> int:
+    """Kleinste Snowflake, die noch per Bulk-Delete gelöscht werden darf."""
+    now = time.time() if now is None else now
+    return int((now - BULK_MAX_AGE) * 1000 - discord.utils.DISCORD_EPOCH) << 22
+
+
+class PurgeManager:
+    def __init__(self, db, queue, delete_interval: float = 0.5, progress_interval: float = 5.0):
+        self.db = db
+        self.queue = queue
+        self.delete_interval = delete_interval
+        self.progress_interval = progress_interval
+        self.jobs = {}  # channel_id -> asyncio.Task
+        self.resumed = False
+
+    def _path(self, channel_id) -> str:
+        return f"purge_jobs/{channel_id}"
+
+    def is_running(self, channel_id) -> bool:
+        return channel_id in self.jobs
+
+    async def start(self, channel, before: int, status_message, delete_pinned: bool = False):
+        """Löscht alle Nachrichten in `channel`, die älter als die Snowflake `before` sind."""
+        state = {
+            "guild_id": str(channel.guild.id),
+            "before": str(before),
+            "delete_pinned": delete_pinned,
+            "deleted": 0,
+            "status_message_id": str(status_message.id)
+        }
+        await self.db.set(self._path(channel.id), state)
+        self._spawn(channel, state)
+
+    async def resume(self, bot):
+        """Setzt gespeicherte Jobs fort, deren Guild dieser Bot (bzw. Shard) sieht."""
+        self.resumed = True
+        jobs = await self.db.get("purge_jobs") or {}
+        for channel_id, state in jobs.items():
+            if not isinstance(state, dict) or bot.get_guild(int(state.get("guild_id", 0))) is None:
+                continue
+            channel = bot.get_channel(int(channel_id))
+            if channel is None:
+                await self.db.delete(self._path(channel_id))
+            elif not self.is_running(channel.id):
+                print(f"Resuming purge of #{channel.name} ({state.get('deleted', 0)} deleted so far)", flush=True)
+                self._spawn(channel, state)
+
+    def _spawn(self, channel, state: dict):
+        task = asyncio.create_task(self._run(channel, state))
+        self.jobs[channel.id] = task
+        task.add_done_callback(lambda _: self.jobs.pop(channel.id, None))
+
+    def _report(self, channel, state: dict, text: str):
+        message = channel.get_partial_message(int(state["status_message_id"]))
+        # nur der neueste Stand wird gesendet
+        self.queue.submit(f"channel:{channel.id}", lambda: message.edit(content=text), key=("purge_status", channel.id))
+
+    async def _run(self, channel, state: dict):
+        before = discord.Object(int(state["before"]))
+        delete_pinned = state.get("delete_pinned", False)
+        deleted = state.get("deleted", 0)
+        last_report = 0.0
+        try:
+            while True:
+                page = [message async for message in channel.history(limit=100, before=before)]
+                if not page:
+                    break
+                before = page[-1]
+                cutoff = bulk_cutoff()
+                targets = [message for message in page if delete_pinned or not message.pinned]
+                recent = [message for message in targets if message.id >= cutoff]
+                old = [message for message in targets if message.id < cutoff]
+
+                if len(recent) >= 2:
+                    await channel.delete_messages(recent)
+                    deleted += len(recent)
+                else:
+                    # einzelne Nachricht (Bulk-Delete braucht mindestens zwei) wie die alten löschen
+                    old = recent + old
+
+                for message in old:
+                    try:
+                        await message.delete()
+                        deleted += 1
+                    except discord.NotFound:
+                        # war schon gelöscht
+                        pass
+                    await asyncio.sleep(self.delete_interval)
+
+                state["before"] = str(page[-1].id)
+                state["deleted"] = deleted
+                await self.db.update(self._path(channel.id), {"before": state["before"], "deleted": deleted})
+                if time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    self._report(channel, state, f"🧹 Deleting messages... {deleted} deleted so far.")
+        except asyncio.CancelledError:
+            # Checkpoint bleibt, beim nächsten Start geht es weiter
+            raise
+        except (discord.Forbidden, discord.NotFound) as e:
+            print(f"Purge of #{channel.name} aborted: {e}", flush=True)
+            await self.db.delete(self._path(channel.id))
+            self._report(channel, state, f"⚠️ Purge aborted after {deleted} messages: {e}")
+            return
+        except Exception as e:
+            print(f"Purge of #{channel.name} failed, will resume on restart: {e}", flush=True)
+            self._report(channel, state, f"⚠️ Purge paused after {deleted} messages, it will continue after a restart.")
+            return
+
+        await self.db.delete(self._path(channel.id))
+        self._report(channel, state, f"✅ Deleted {deleted} messages.")
+        print(f"Purge of #{channel.name} finished: {deleted} messages", flush=True)
+
+    async def stop(self):
+        for task in list(self.jobs.values()):
+            task.cancel()
+        await asyncio.gather(*self.jobs.values(), return_exceptions=True)
@@ -0,0 +1,189 @@
+import math
+import random
+
+from atomic import KeyedLocks
+
+
+class _End:
+    """Sentinel, der größer ist als jeder andere Schlüssel."""
+
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return self is other
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, next, width):
+        self.key = key
+        self.next = next
+        self.width = width
+
+
+_NIL = _Node(_End(), [], [])
+
+
+class IndexableSkipList:
+    """
+    Sortierte Liste als Skip-List mit Breitenangaben pro Link:
+    Einfügen, Löschen und Rang-Abfrage in O(log n), die k Einträge ab
+    einer Position in O(log n + k).
+    """
+
+    def __init__(self, expected_size: int = 100000):
+        self.size = 0
+        self.max_levels = int(1 + math.log2(max(expected_size, 2)))
+        self.head = _Node("HEAD", [_NIL] * self.max_levels, [1] * self.max_levels)
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, key):
+        chain = [None] * self.max_levels
+        steps_at_level = [0] * self.max_levels
+        node = self.head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        height = min(self.max_levels, 1 - int(math.log2(1.0 - random.random())))
+        new_node = _Node(key, [None] * height, [None] * height)
+        steps = 0
+        for level in range(height):
+            prev = chain[level]
+            new_node.next[level] = prev.next[level]
+            prev.next[level] = new_node
+            new_node.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(height, self.max_levels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain = [None] * self.max_levels
+        node = self.head
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+        target = chain[0].next[0]
+        if target is _NIL or target.key != key:
+            raise KeyError(key)
+
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), self.max_levels):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def index(self, key) -> int:
+        """0-basierte Position von `key`."""
+        node = self.head
+        position = 0
+        for level in reversed(range(self.max_levels)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        target = node.next[0]
+        if target is _NIL or target.key != key:
+            raise KeyError(key)
+        return position
+
+    def slice(self, start: int, count: int) -> list:
+        """Bis zu `count` Schlüssel ab Position `start`."""
+        if start < 0 or start >= self.size or count <= 0:
+            return []
+        node = self.head
+        remaining = start + 1
+        for level in reversed(range(self.max_levels)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        result = []
+        while node is not _NIL and len(result) < count:
+            result.append(node.key)
+            node = node.next[0]
+        return result
+
+
+class Leaderboard:
+    """
+    Rangliste pro Guild, sortiert nach XP (absteigend, bei Gleichstand nach User-ID).
+    Eine Guild wird beim ersten Zugriff einmal komplett geladen und danach
+    bei jeder XP-Änderung inkrementell gepflegt.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.guilds = {}  # guild_id -> (IndexableSkipList, {user_id: xp})
+        self._loading = KeyedLocks("leaderboard")
+
+    def is_loaded(self, guild_id) -> bool:
+        return str(guild_id) in self.guilds
+
+    async def ensure(self, guild_id, overrides: dict = None):
+        """
+        Lädt die Guild, falls nötig. `overrides` (user_id -> xp) sind noch nicht
+        geschriebene Werte (z.B. aus dem XPLedger), die Vorrang vor der Datenbank haben.
+        """
+        guild_id = str(guild_id)
+        if guild_id in self.guilds:
+            return
+        async with self._loading.hold(guild_id):
+            if guild_id in self.guilds:
+                return
+            users = await self.db.get(f"servers/{guild_id}/users") or {}
+            xps = {}
+            for user_id, data in users.items():
+                if isinstance(data, dict) and str(user_id).isdigit():
+                    xps[int(user_id)] = data.get("xp", 0)
+            for user_id, xp in (overrides or {}).items():
+                xps[int(user_id)] = xp
+
+            ranks = IndexableSkipList(max(len(xps), 100))
+            for user_id, xp in xps.items():
+                ranks.insert((-xp, user_id))
+            self.guilds[guild_id] = (ranks, xps)
+
+    def update(self, guild_id, user_id, xp: int):
+        entry = self.guilds.get(str(guild_id))
+        if entry is None:
+            # wird beim ersten Abruf ohnehin frisch geladen
+            return
+        ranks, xps = entry
+        user_id = int(user_id)
+        old = xps.get(user_id)
+        if old == xp:
+            return
+        if old is not None:
+            ranks.remove((-old, user_id))
+        ranks.insert((-xp, user_id))
+        xps[user_id] = xp
+
+    def rank(self, guild_id, user_id):
+        """1-basierter Rang oder None, wenn der User keine XP hat."""
+        ranks, xps = self.guilds[str(guild_id)]
+        user_id = int(user_id)
+        if user_id not in xps:
+            return None
+        return ranks.index((-xps[user_id], user_id)) + 1
+
+    def page(self, guild_id, start: int, count: int) -> list:
+        """Liste von (rang, user_id, xp) ab Position `start` (0-basiert)."""
+        ranks, _ = self.guilds[str(guild_id)]
+        return [(start + i + 1, user_id, -neg_xp) for i, (neg_xp, user_id) in enumerate(ranks.slice(start, count))]
+
+    def invalidate(self, guild_id):
+        """Verwirft die Guild (z.B. nach Massenänderungen), sie wird beim nächsten Abruf neu geladen."""
+        self.guilds.pop(str(guild_id), None)
+
+    def size(self, guild_id) -> int:
+        return len(self.guilds[str(guild_id)][0])
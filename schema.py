@@ -0,0 +1,67 @@
+"""
+Defaults werden nicht mehr in jeden Server-/Usereintrag geschrieben.
+In der Datenbank stehen nur Felder, die vom Default abweichen; beim Lesen
+werden die Defaults darübergelegt. `data/_v` merkt sich die Schema-Version
+eines Servers, Migrationen laufen beim Lesen und werden erst beim nächsten
+Schreiben persistiert.
+"""
+import copy
+
+SCHEMA_VERSION = 1
+VERSION_KEY = "_v"
+# Platzhalter in Maps mit Zahlen-Keys (z.B. level_roles): bleibt beim Schreiben
+# erhalten, sonst liefert die Realtime Database die Map als Liste zurück
+PLACEHOLDER = "_init"
+
+# version -> fn(data) -> data, migriert einen Eintrag von `version - 1` auf `version`.
+# Neue Default-Keys brauchen keine Migration, die kommen über overlay().
+MIGRATIONS = {}
+
+
+def overlay(defaults: dict, stored: dict) -> dict:
+    """Legt `stored` über eine Kopie von `defaults` (rekursiv für dicts)."""
+    result = copy.deepcopy(defaults)
+    for key, value in (stored or {}).items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = overlay(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+
+def strip_defaults(defaults: dict, record: dict) -> dict:
+    """Gegenstück zu overlay(): entfernt alle Felder, die dem Default entsprechen."""
+    result = {}
+    for key, value in (record or {}).items():
+        if key not in defaults:
+            result[key] = value
+        elif isinstance(value, dict) and isinstance(defaults[key], dict):
+            stripped = strip_defaults(defaults[key], value)
+            if stripped:
+                result[key] = stripped
+        elif value != defaults[key]:
+            result[key] = value
+    if result and PLACEHOLDER in defaults:
+        result[PLACEHOLDER] = defaults[PLACEHOLDER]
+    return result
+
+
+def migrate(stored: dict):
+    """
+    Bringt einen gespeicherten Servereintrag auf SCHEMA_VERSION.
+    Gibt (daten, veraltet) zurück; `veraltet` heißt, dass der Eintrag beim
+    nächsten Schreiben komplett neu geschrieben werden sollte.
+    """
+    data = dict(stored or {})
+    version = data.pop(VERSION_KEY, 0)
+    outdated = version < SCHEMA_VERSION
+    while version < SCHEMA_VERSION:
+        version += 1
+        if version in MIGRATIONS:
+            data = MIGRATIONS[version](data)
+    return data, outdated
+
+
+def load(defaults: dict, stored: dict) -> dict:
+    data, _ = migrate(stored)
+    return overlay(defaults, data)
@@ -0,0 +1,166 @@
+"""
+Lokaler Snapshot des Guild-Zustands (Config, XP der Member, Poll-Metadaten)
+in einer SQLite-Datei, damit der Bot nach einem Neustart sofort mit warmen
+Caches startet. Die Markierung `synced_at` ist der Zeitpunkt, bis zu dem
+alles im Snapshot auch in der Datenbank steht; `reconcile` gleicht danach
+im Hintergrund nur die Änderungen seit diesem Zeitpunkt ab.
+
+Auf Firebase braucht die Abfrage der geänderten User einen Index, sonst
+antwortet der Server mit 400 "Index not defined" und jede Guild wird
+komplett gelesen. In den Datenbankregeln ergänzen:
+
+    "servers": {"$guild_id": {"users": {".indexOn": ["last_message_time"]}}}
+"""
+import asyncio
+import dataclasses
+import json
+import os
+import sqlite3
+import time
+
+
+class Snapshot:
+    def __init__(self, path: str = "data/snapshot.db"):
+        self.path = path
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS entries (kind TEXT, key TEXT, value TEXT NOT NULL, PRIMARY KEY (kind, key)) WITHOUT ROWID")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        return conn
+
+    def load(self):
+        """Inhalt des Snapshots oder None, wenn es noch keinen gibt."""
+        if not os.path.exists(self.path):
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'synced_at'").fetchone()
+            if row is None:
+                return None
+            data = {"synced_at": float(row[0]), "configs": {}, "users": {}, "dirty": {}, "polls": {}}
+            for kind, key, value in conn.execute("SELECT kind, key, value FROM entries"):
+                data[kind][key] = json.loads(value)
+            return data
+        finally:
+            conn.close()
+
+    def save(self, synced_at: float, data: dict):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM entries")
+            conn.executemany(
+                "INSERT INTO entries (kind, key, value) VALUES (?, ?, ?)",
+                ((kind, key, json.dumps(value)) for kind in ("configs", "users", "dirty", "polls") for key, value in data[kind].items())
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced_at', ?)", (str(synced_at),))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+
+def capture(guild_configs, xp_ledger, poll_store) -> dict:
+    """
+    Kopiert den aktuellen Zustand (im Event-Loop, damit er konsistent ist).
+    Noch nicht abgeglichene User (XPLedger.unverified) fehlen, sie sind
+    beim nächsten Start nicht aktueller als `synced_at` und kommen dann
+    aus der Datenbank.
+    """
+    unverified = xp_ledger.unverified
+    return {
+        # veraltete Einträge (schema.py) werden beim Abgleich wieder als solche erkannt
+        "configs": {guild_id: dataclasses.asdict(config) for guild_id, config in guild_configs.configs.items()},
+        # pro User [xp, level, last_message_time]
+        "users": {guild_id: {str(user_id): [xp, level, last] for user_id, xp, level, last in store.rows()
+                             if str(user_id) not in unverified.get(guild_id, ())}
+                  for guild_id, store in xp_ledger.users.items() if len(store)},
+        "dirty": {guild_id: sorted(set(user_ids).difference(unverified.get(guild_id, ())))
+                  for guild_id, user_ids in xp_ledger.dirty.items() if user_ids},
+        "polls": {f"{guild_id}/{poll_id}": meta for (guild_id, poll_id), meta in poll_store.meta.items()},
+    }
+
+
+def restore(data: dict, guild_configs, xp_ledger, poll_store):
+    for guild_id, config in data["configs"].items():
+        guild_configs.restore(guild_id, config)
+    for guild_id, users in data["users"].items():
+        xp_ledger.restore(guild_id, users, data["dirty"].get(guild_id, ()))
+    for key, meta in data["polls"].items():
+        guild_id, poll_id = key.split("/", 1)
+        poll_store.restore(guild_id, poll_id, meta)
+    print(f"Restored snapshot: {len(data['configs'])} configs, {sum(map(len, data['users'].values()))} members, "
+          f"{len(data['polls'])} polls (synced {int(time.time() - data['synced_at'])}s ago)", flush=True)
+
+
+async def save(snapshot: Snapshot, guild_configs, xp_ledger, poll_store):
+    # erst schreiben, dann ist alles bis `synced_at` in der Datenbank
+    synced_at = time.time()
+    await xp_ledger.flush_all()
+    data = capture(guild_configs, xp_ledger, poll_store)
+    await asyncio.to_thread(snapshot.save, synced_at, data)
+
+
+async def reconcile(db, data: dict, guild_configs, xp_ledger, poll_store, concurrency: int = 5, slack: float = 60.0):
+    """
+    Gleicht den wiederhergestellten Zustand mit der Datenbank ab:
+    - Configs werden neu gelesen (klein, eine Anfrage pro Guild)
+    - User nur, wenn sie seit `synced_at` geschrieben haben (orderBy last_message_time),
+      siehe XPLedger.reconcile_guild
+    - Polls nur, wenn sie im Snapshot noch offen waren
+    `slack` fängt Abweichungen der Uhren zwischen Prozessen ab.
+    """
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    since = int(data["synced_at"] - slack)
+    changed = {"configs": 0, "users": 0, "polls": 0}
+
+    async def config(guild_id):
+        async with semaphore:
+            if await guild_configs.refresh(guild_id):
+                changed["configs"] += 1
+
+    async def fetch_users(guild_id):
+        path = f"servers/{guild_id}/users"
+        try:
+            return await db.query(path, "last_message_time", since)
+        except Exception as e:
+            # z.B. fehlender Index auf Firebase (siehe Moduldoku), dann eben alle User
+            print(f"Query of {path} failed, reading all users: {e}", flush=True)
+            return await db.get(path)
+
+    async def users(guild_id):
+        async with semaphore:
+            changed["users"] += await xp_ledger.reconcile_guild(guild_id, lambda: fetch_users(guild_id))
+
+    async def poll(key, meta):
+        guild_id, poll_id = key.split("/", 1)
+        async with semaphore:
+            closed = await db.get(f"servers/{guild_id}/polls/{poll_id}/closed")
+        if closed and not meta["closed"]:
+            cached = poll_store.meta.get((guild_id, poll_id))
+            if cached is not None:
+                cached["closed"] = True
+            changed["polls"] += 1
+
+    results = await asyncio.gather(
+        *(config(guild_id) for guild_id in data["configs"]),
+        *(users(guild_id) for guild_id in data["users"]),
+        *(poll(key, meta) for key, meta in data["polls"].items() if not meta["closed"]),
+        return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, Exception)]
+    print(f"Snapshot reconciled in {time.perf_counter() - started:.2f}s: {changed}, {len(errors)} errors", flush=True)
+    for error in errors[:5]:
+        print(f"Reconcile error: {error!r}", flush=True)
+
+
+async def run_periodically(snapshot: Snapshot, interval: float, guild_configs, xp_ledger, poll_store):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await save(snapshot, guild_configs, xp_ledger, poll_store)
+        except Exception as e:
+            print(f"Saving snapshot failed: {e}", flush=True)
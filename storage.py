@@ -0,0 +1,332 @@
+"""
+Speicher-Backends für den Bot. Alle Backends bilden den Baum der Realtime
+Database nach (Pfade wie `servers/{id}/data/levels`) und haben dieselbe
+Schnittstelle wie AsyncFirebaseDB, siehe StorageBackend.
+
+Auswahl über STORAGE_BACKEND:
+- firebase (Standard): Realtime Database über REST
+- sqlite: lokale SQLite-Datei (WAL), Pfad über SQLITE_PATH
+- memory: SQLite im Arbeitsspeicher, z.B. für Tests und Benchmarks
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Protocol
+
+import schema
+
+
+class StorageBackend(Protocol):
+    async def get(self, path: str) -> Any: ...
+
+    # Kinder von `path`, deren Feld `order_by` >= `start_at` ist (wie orderBy/startAt der Realtime Database)
+    async def query(self, path: str, order_by: str, start_at) -> dict: ...
+
+    async def set(self, path: str, value) -> None: ...
+
+    # `value` darf Multi-Path-Keys ("a/b/c") und increment_value() enthalten
+    async def update(self, path: str, value: dict) -> None: ...
+
+    async def delete(self, path: str) -> None: ...
+
+    async def increment(self, path: str, delta: int = 1) -> None: ...
+
+    # fn(aktueller_wert) -> neuer_wert, Rückgabe (alter Wert, neuer Wert)
+    async def transaction(self, path: str, fn: Callable, max_retries: int = 25) -> tuple: ...
+
+    async def close(self) -> None: ...
+
+
+def increment_value(delta: int) -> dict:
+    """Server-Value für atomare Inkremente (auch innerhalb von Multi-Path-Updates)."""
+    return {".sv": {"increment": delta}}
+
+
+def _is_increment(value) -> bool:
+    return isinstance(value, dict) and ".sv" in value
+
+
+def _split(path: str) -> list:
+    return [key for key in path.strip("/").split("/") if key]
+
+
+def _flatten(prefix: str, value, rows: list):
+    if isinstance(value, list):
+        value = {str(i): v for i, v in enumerate(value)}
+    if isinstance(value, dict):
+        for key, child in value.items():
+            _flatten(f"{prefix}/{key}" if prefix else str(key), child, rows)
+    elif value is not None:
+        rows.append((prefix, json.dumps(value)))
+
+
+def _as_array(node):
+    # wie die Realtime Database: Objekte mit überwiegend fortlaufenden Zahlen-Keys werden zu Listen
+    if not isinstance(node, dict) or not node or not all(key.isdigit() for key in node):
+        return node
+    indexes = [int(key) for key in node]
+    if max(indexes) >= 2 * len(node):
+        return node
+    result = [None] * (max(indexes) + 1)
+    for key, value in node.items():
+        result[int(key)] = value
+    return result
+
+
+def _inflate(base: str, rows) -> Any:
+    root = {}
+    for path, raw in rows:
+        value = json.loads(raw)
+        if path == base:
+            return value
+        keys = _split(path[len(base):] if base else path)
+        node = root
+        for key in keys[:-1]:
+            node = node.setdefault(key, {})
+        node[keys[-1]] = value
+
+    def convert(node):
+        if isinstance(node, dict):
+            return _as_array({key: convert(child) for key, child in node.items()})
+        return node
+
+    return convert(root) if root else None
+
+
+class SQLiteBackend:
+    """
+    Lokales Backend auf SQLite. Jedes Blatt des Baums ist eine Zeile
+    (pfad, json-wert); Teilbäume werden über einen Bereichsscan auf dem
+    Primärschlüssel gelesen. Mit `path=":memory:"` rein im Arbeitsspeicher.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS nodes (path TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID")
+        self._lock = threading.Lock()
+
+    # --- synchrone Primitive, laufen im Thread-Pool bzw. innerhalb einer SQL-Transaktion
+
+    def _read(self, path: str):
+        path = "/".join(_split(path))
+        if not path:
+            rows = self._conn.execute("SELECT path, value FROM nodes").fetchall()
+        else:
+            # alle Pfade == path oder mit Prefix "path/" ('/' + 1 == '0')
+            rows = self._conn.execute(
+                "SELECT path, value FROM nodes WHERE path = ? OR (path >= ? AND path < ?)",
+                (path, path + "/", path + "0")
+            ).fetchall()
+        return _inflate(path, rows)
+
+    def _write(self, path: str, value):
+        path = "/".join(_split(path))
+        if _is_increment(value):
+            row = self._conn.execute("SELECT value FROM nodes WHERE path = ?", (path,)).fetchone()
+            current = json.loads(row[0]) if row else 0
+            value = (current if isinstance(current, (int, float)) else 0) + value[".sv"]["increment"]
+
+        # Teilbaum entfernen ...
+        if path:
+            self._conn.execute("DELETE FROM nodes WHERE path = ? OR (path >= ? AND path < ?)", (path, path + "/", path + "0"))
+            # ... und Blätter auf Elternpfaden, die jetzt zu Objekten werden
+            keys = _split(path)
+            parents = ["/".join(keys[:i]) for i in range(1, len(keys))]
+            if parents:
+                self._conn.execute(f"DELETE FROM nodes WHERE path IN ({','.join('?' * len(parents))})", parents)
+        else:
+            self._conn.execute("DELETE FROM nodes")
+
+        rows = []
+        _flatten(path, value, rows)
+        if rows:
+            self._conn.executemany("INSERT OR REPLACE INTO nodes (path, value) VALUES (?, ?)", rows)
+
+    def _atomic(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    async def _run(self, fn):
+        return await asyncio.to_thread(self._atomic, fn)
+
+    # --- StorageBackend
+
+    async def get(self, path: str):
+        return await self._run(lambda: self._read(path))
+
+    async def query(self, path: str, order_by: str, start_at):
+        def select():
+            base = "/".join(_split(path))
+            prefix = f"{base}/" if base else ""
+            # Blätter `{path}/{kind}/{order_by}` mit passendem Wert finden, dann die Kinder lesen
+            rows = self._conn.execute(
+                "SELECT path, value FROM nodes WHERE path >= ? AND path < ? AND path LIKE ?",
+                (prefix, (base + "0") if base else "\uffff", f"{prefix}%/{order_by}")
+            ).fetchall()
+            result = {}
+            for leaf, raw in rows:
+                child = leaf[len(prefix):-len(order_by) - 1]
+                value = json.loads(raw)
+                # "_" ist in LIKE ein Platzhalter, daher exakt nachprüfen
+                if leaf.endswith(f"/{order_by}") and "/" not in child and isinstance(value, (int, float)) and value >= start_at:
+                    result[child] = self._read(f"{prefix}{child}")
+            return result
+
+        return await self._run(select)
+
+    async def set(self, path: str, value):
+        # leeres dict vermeiden
+        if isinstance(value, dict) and len(value) == 0:
+            value = {"_init": True}
+        await self._run(lambda: self._write(path, value))
+
+    async def update(self, path: str, value: dict):
+        # leeres dict vermeiden
+        if isinstance(value, dict) and len(value) == 0:
+            return
+
+        def apply():
+            for key, child in value.items():
+                self._write(f"{path.rstrip('/')}/{key}", child)
+
+        await self._run(apply)
+
+    async def delete(self, path: str):
+        await self._run(lambda: self._write(path, None))
+
+    async def increment(self, path: str, delta: int = 1):
+        await self._run(lambda: self._write(path, increment_value(delta)))
+
+    async def transaction(self, path: str, fn, max_retries: int = 25):
+        def apply():
+            current = self._read(path)
+            new_value = fn(current)
+            self._write(path, new_value)
+            return current, new_value
+
+        # BEGIN IMMEDIATE sperrt die Datenbank, Retries sind nicht nötig
+        return await self._run(apply)
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_backend(kind: str = None, **options):
+    """
+    Erstellt das Backend `kind` (Standard: Umgebungsvariable STORAGE_BACKEND).
+    Optionen für firebase: db_url, cred_path, max_concurrency, timeout;
+    für sqlite: sqlite_path.
+    """
+    kind = (kind or os.getenv("STORAGE_BACKEND") or "firebase").lower()
+    if kind == "firebase":
+        # firebase_admin nur laden, wenn es auch gebraucht wird
+        import firebase
+        return firebase.AsyncFirebaseDB(
+            options["db_url"], options["cred_path"],
+            max_concurrency=options.get("max_concurrency", 20),
+            timeout=options.get("timeout", 10.0)
+        )
+    if kind == "sqlite":
+        return SQLiteBackend(options.get("sqlite_path") or os.getenv("SQLITE_PATH", "data/tigerbot.db"))
+    if kind == "memory":
+        return SQLiteBackend(":memory:")
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+async def compact_guilds(db, guilds, server_defaults: dict, user_defaults: dict, concurrency: int = 5, guard=None):
+    """
+    Entfernt materialisierte Defaults aus bestehenden Einträgen (siehe schema.py).
+    Pro Guild gibt es zwei Reads (`data`, `users`) und höchstens ein
+    Multi-Path-Update, bis zu `concurrency` Guilds werden parallel abgeglichen.
+    `guard(guild_id)` ist ein optionaler Async-Context-Manager, der andere
+    Schreiber der Guild so lange aufhält (z.B. XPLedger.writing).
+
+    Ersetzt bewusst den früheren Startabgleich, der fehlende Felder mit
+    Defaults auffüllte: die kommen jetzt beim Lesen dazu, es gibt nichts mehr
+    zu ergänzen. Ein shallow Read reicht dafür nicht, weil die Werte mit den
+    Defaults verglichen werden müssen; gelesen werden aber nur die beiden
+    Teilbäume und nicht der ganze Server (Polls, Tickets, ...).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker(guild):
+        async with semaphore:
+            try:
+                if guard is None:
+                    await compact_guild(db, guild, server_defaults, user_defaults)
+                else:
+                    async with guard(guild.id):
+                        await compact_guild(db, guild, server_defaults, user_defaults)
+            except Exception as e:
+                print(f"Compaction of guild {guild.id} failed: {e}", flush=True)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(guild) for guild in guilds))
+    print(f"Database compaction for {len(guilds)} guilds took {time.perf_counter() - started:.2f}s", flush=True)
+
+
+def default_leaves(defaults: dict, record: dict, prefix: str = "") -> list:
+    """
+    Pfade aller Blätter in `record`, die dem Default entsprechen. Platzhalter
+    (schema.PLACEHOLDER) bleiben, sonst werden Maps mit Zahlen-Keys zu Listen.
+    """
+    paths = []
+    for key, value in record.items():
+        if key not in defaults or key == schema.PLACEHOLDER:
+            continue
+        if isinstance(value, dict) and isinstance(defaults[key], dict):
+            paths.extend(default_leaves(defaults[key], value, f"{prefix}{key}/"))
+        elif value == defaults[key]:
+            paths.append(f"{prefix}{key}")
+    return paths
+
+
+async def compact_guild(db, guild, server_defaults: dict, user_defaults: dict):
+    """
+    Löscht alle Felder eines Servers, die nur den Default enthalten. Gelöscht
+    werden nur einzelne Blätter, nie ganze Knoten, damit Werte, die seit dem
+    Lesen geschrieben wurden (andere Felder, XP-Inkremente), erhalten bleiben.
+    """
+    started = time.perf_counter()
+    server_path = f"servers/{guild.id}"
+    data, users = await asyncio.gather(db.get(f"{server_path}/data"), db.get(f"{server_path}/users"))
+
+    updates = {}
+    if isinstance(data, dict):
+        stored = {key: value for key, value in data.items() if key != schema.VERSION_KEY}
+        migrated, _ = schema.migrate(data)
+        # Einträge, die eine Migration ändern würde, schreibt die Config beim nächsten Update neu
+        if migrated == stored:
+            for path in default_leaves(server_defaults, stored):
+                updates[f"data/{path}"] = None
+
+    if isinstance(users, dict):
+        for user_id, user_data in users.items():
+            if not isinstance(user_data, dict):
+                # Platzhalter wie "_init": True
+                updates[f"users/{user_id}"] = None
+                continue
+            for path in default_leaves(user_defaults, user_data):
+                updates[f"users/{user_id}/{path}"] = None
+
+    if updates:
+        await db.update(server_path, updates)
+    print(f"Guild {guild.id}: {len(updates)} paths compacted in {time.perf_counter() - started:.2f}s", flush=True)
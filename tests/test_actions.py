@@ -0,0 +1,149 @@
+import asyncio
+
+import discord
+
+import actions
+
+
+class Response:
+    def __init__(self, status):
+        self.status = status
+        self.reason = "test"
+
+
+def http_error(status):
+    return discord.HTTPException(Response(status), "test")
+
+
+def queue(**kwargs):
+    return actions.ActionQueue(workers=2, base_delay=0.01, **kwargs)
+
+
+def test_retries_transient_errors():
+    async def run():
+        q = queue()
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise http_error(503)
+            return "done"
+
+        assert await q.submit("b", flaky) == "done"
+        assert len(attempts) == 3 and q.retried == 2
+        await q.stop()
+
+    asyncio.run(run())
+
+
+def test_gives_up_after_max_retries_and_on_client_errors():
+    async def run():
+        q = queue(max_retries=1)
+
+        async def always(status):
+            raise http_error(status)
+
+        for status, attempts in ((429, 2), (403, 1)):
+            before = q.retried
+            future = q.submit("b", lambda: always(status))
+            try:
+                await future
+            except discord.HTTPException as e:
+                assert e.status == status
+            assert q.retried - before == attempts - 1
+        assert q.failed == 2
+        await q.stop()
+
+    asyncio.run(run())
+
+
+def test_coalesces_pending_actions_with_same_key():
+    async def run():
+        q = queue(bucket_concurrency=1)
+        ran = []
+        blocker = asyncio.Event()
+
+        async def block():
+            await blocker.wait()
+
+        async def record(value):
+            ran.append(value)
+            return value
+
+        q.submit("b", block)
+        first = q.submit("b", lambda: record(1), key="k")
+        second = q.submit("b", lambda: record(2), key="k")
+        assert first is second and q.coalesced == 1
+
+        blocker.set()
+        assert await first == 2
+        assert ran == [2]
+        await q.stop()
+
+    asyncio.run(run())
+
+
+def test_submit_during_retry_merges_into_it():
+    async def run():
+        q = queue()
+        ran = []
+
+        async def failing():
+            ran.append("old")
+            raise http_error(500)
+
+        async def newer():
+            ran.append("new")
+            return "new"
+
+        first = q.submit("b", failing, key="k")
+        await asyncio.sleep(0.005)
+        assert len(q) == 1 and "k" in q.pending
+        second = q.submit("b", newer, key="k")
+        assert first is second
+        assert await first == "new"
+        assert ran == ["old", "new"]
+        await q.stop()
+
+    asyncio.run(run())
+
+
+def test_priority_order():
+    async def run():
+        q = actions.ActionQueue(workers=1)
+        ran = []
+        blocker = asyncio.Event()
+
+        async def block():
+            await blocker.wait()
+
+        async def record(value):
+            ran.append(value)
+
+        q.submit("a", block)
+        await asyncio.sleep(0)
+        futures = [q.submit("b", lambda: record("announcement"), priority=actions.ANNOUNCEMENT),
+                   q.submit("c", lambda: record("normal")),
+                   q.submit("d", lambda: record("interaction"), priority=actions.INTERACTION)]
+        blocker.set()
+        await asyncio.gather(*futures)
+        assert ran == ["interaction", "normal", "announcement"]
+        await q.stop()
+
+    asyncio.run(run())
+
+
+def test_stop_cancels_leftover_actions():
+    async def run():
+        q = actions.ActionQueue(workers=1)
+
+        async def slow():
+            await asyncio.sleep(10)
+
+        futures = [q.submit("b", slow) for _ in range(3)]
+        await q.stop(timeout=0.05)
+        assert all(future.cancelled() for future in futures)
+        assert len(q) == 0
+
+    asyncio.run(run())
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+import config
+import storage
+from benchmarks.fakes import FakeDB
+
+SERVER_DEFAULTS = {
+    "levels": {
+        "enabled": True,
+        "xp_per_message": 5,
+        "level_roles": {"_init": True},
+    },
+}
+
+
+class RealtimeDB(FakeDB):
+    """FakeDB, die Maps mit Zahlen-Keys wie die Realtime Database als Liste liefert."""
+
+    async def get(self, path: str):
+        def convert(node):
+            if isinstance(node, dict):
+                return storage._as_array({key: convert(child) for key, child in node.items()})
+            return node
+        return convert(await super().get(path))
+
+
+@pytest.fixture(params=["sqlite", "firebase"])
+def db(request):
+    return storage.SQLiteBackend() if request.param == "sqlite" else RealtimeDB()
+
+
+def test_from_dict_accepts_list():
+    levels = config.LevelsConfig.from_dict({"level_roles": [None, 111, 222]})
+    assert levels.level_roles == {"1": 111, "2": 222}
+
+
+def test_level_roles_survive_reload(db):
+    async def run():
+        cache = config.GuildConfigCache(db, SERVER_DEFAULTS)
+        for level, role_id in (("1", 111), ("2", 222)):
+            roles = dict((await cache.get(1)).levels.level_roles)
+            roles[level] = role_id
+            await cache.update(1, {"level_roles": roles}, section="levels")
+
+        fresh = config.GuildConfigCache(db, SERVER_DEFAULTS)
+        assert (await fresh.get(1)).levels.level_roles == {"1": 111, "2": 222}
+        # Platzhalter bleibt gespeichert, die Map bleibt damit ein Objekt
+        assert isinstance(await db.get("servers/1/data/levels/level_roles"), dict)
+
+    asyncio.run(run())
+
+
+def test_legacy_list_is_read(db):
+    async def run():
+        await db.set("servers/1/data/levels/level_roles", {"1": 111, "2": 222})
+        cache = config.GuildConfigCache(db, SERVER_DEFAULTS)
+        assert (await cache.get(1)).levels.level_roles == {"1": 111, "2": 222}
+        assert await cache.refresh(1) is False
+
+    asyncio.run(run())
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+import levels
+import snapshot
+import xp
+from benchmarks.fakes import FakeDB
+
+USER_DEFAULTS = {"xp": 0, "level": 0, "last_message_time": 0}
+CURVE = levels.get_curve("linear", 100)
+
+
+class NoIndexDB(FakeDB):
+    """Wie Firebase ohne `.indexOn`: Abfragen schlagen fehl."""
+
+    async def query(self, path: str, order_by: str, start_at):
+        raise RuntimeError("400 Index not defined")
+
+
+class OfflineDB(NoIndexDB):
+    async def get(self, path: str):
+        raise RuntimeError("offline")
+
+
+class Stub:
+    configs = {}
+    meta = {}
+
+
+def restored_ledger(db):
+    ledger = xp.XPLedger(db, USER_DEFAULTS, flush_threshold=1000)
+    ledger.restore("1", {"5": [100, 1, 900], "6": [80, 0, 950]}, dirty=["6"])
+    return ledger
+
+
+def test_reconcile_falls_back_to_full_read():
+    async def run():
+        db = NoIndexDB(data={"servers": {"1": {"users": {"5": {"xp": 500, "level": 5, "last_message_time": 1000}}}}})
+        ledger = restored_ledger(db)
+        await snapshot.reconcile(db, {"synced_at": 960, "configs": {}, "users": {"1": {}}, "polls": {}},
+                                 Stub(), ledger, Stub())
+        assert ledger.unverified == {}
+        assert ledger.users["1"].get(5).xp == 500
+        # 6 war im Snapshot dirty und ist in der Datenbank nicht neuer
+        assert ledger.dirty["1"] == {"6"}
+
+    asyncio.run(run())
+
+
+def test_failed_reconcile_writes_local_state():
+    async def run():
+        db = OfflineDB()
+        ledger = restored_ledger(db)
+        ledger.award("1", "5", 100, CURVE, 2000)
+        with pytest.raises(RuntimeError):
+            await ledger.reconcile_guild("1", lambda: db.get("servers/1/users"))
+        assert ledger.unverified == {}
+        assert ledger.dirty["1"] == {"5", "6"}
+        assert ledger.deltas["1"] == {}
+
+        online = FakeDB()
+        ledger.db = online
+        await ledger.flush_all()
+        assert await online.get("servers/1/users/5") == {"xp": 200, "level": 2, "last_message_time": 2000}
+        assert await online.get("servers/1/users/6") == {"xp": 80, "level": 0, "last_message_time": 950}
+        assert "5" in snapshot.capture(Stub(), ledger, Stub())["users"]["1"]
+
+    asyncio.run(run())
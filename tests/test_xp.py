@@ -0,0 +1,150 @@
+import asyncio
+
+import levels
+import xp
+from benchmarks.fakes import FakeDB
+
+USER_DEFAULTS = {"xp": 0, "level": 0, "last_message_time": 0}
+CURVE = levels.get_curve("linear", 100)
+
+
+class RecordingDB(FakeDB):
+    """Merkt sich die Payloads aller Updates."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.updates = []
+
+    async def update(self, path: str, value: dict):
+        self.updates.append((path, value))
+        await super().update(path, value)
+
+
+class FailingDB(RecordingDB):
+    async def update(self, path: str, value: dict):
+        raise RuntimeError("offline")
+
+
+def ledger_for(db):
+    return xp.XPLedger(db, USER_DEFAULTS, flush_threshold=1000)
+
+
+def test_awards_are_flushed_as_increments():
+    async def run():
+        db = RecordingDB()
+        ledger = ledger_for(db)
+        await ledger.get_user(1, 5)
+        ledger.award(1, 5, 10, CURVE, 100)
+        ledger.award(1, 5, 10, CURVE, 200)
+        # ein anderer Schreiber zwischendurch
+        await db.update("servers/1/users", {"5/xp": {".sv": {"increment": 7}}})
+        await ledger.flush_all()
+
+        assert db.updates[-1][1]["5/xp"] == {".sv": {"increment": 20}}
+        assert await db.get("servers/1/users/5") == {"xp": 27, "level": 0, "last_message_time": 200}
+        assert ledger.dirty == {} and ledger.deltas == {}
+
+    asyncio.run(run())
+
+
+def test_failed_flush_retries_with_absolute_values():
+    async def run():
+        db = FailingDB()
+        ledger = ledger_for(db)
+        await ledger.get_user(1, 5)
+        ledger.award(1, 5, 10, CURVE, 100)
+        await ledger.flush_all()
+        assert ledger.dirty["1"] == {"5"}
+        assert "5" not in ledger.deltas.get("1", {})
+
+        # weitere XP stecken im absoluten Wert, nicht in einem neuen Inkrement
+        ledger.award(1, 5, 10, CURVE, 200)
+        assert "5" not in ledger.deltas.get("1", {})
+        ledger.db = online = RecordingDB()
+        await ledger.flush_all()
+        assert online.updates[-1][1]["5/xp"] == 20
+
+    asyncio.run(run())
+
+
+def test_bulk_update_writes_absolute_values():
+    async def run():
+        db = RecordingDB(data={"servers": {"1": {"users": {
+            "5": {"xp": 100, "level": 1, "last_message_time": 10},
+            "6": {"xp": 300, "level": 3, "last_message_time": 20},
+        }}}})
+        ledger = ledger_for(db)
+        await ledger.get_user(1, 5)
+        ledger.award(1, 5, 50, CURVE, 30)
+        count = await ledger.bulk_update(1, lambda store: store.multiply(2.0, CURVE))
+
+        assert count == 2
+        assert await db.get("servers/1/users") == {
+            "5": {"xp": 300, "level": 3, "last_message_time": 30},
+            "6": {"xp": 600, "level": 6, "last_message_time": 20},
+        }
+        assert all(not isinstance(value, dict) for _, payload in db.updates for value in payload.values())
+
+    asyncio.run(run())
+
+
+def test_get_user_reads_once_under_concurrency():
+    async def run():
+        db = FakeDB(latency=0.01)
+        ledger = ledger_for(db)
+        await asyncio.gather(*(ledger.get_user(1, 5) for _ in range(10)))
+        assert db.calls["get"] == 1
+
+    asyncio.run(run())
+
+
+def test_unverified_users_get_increments_only():
+    async def run():
+        db = RecordingDB(data={"servers": {"1": {"users": {"5": {"xp": 500, "level": 5, "last_message_time": 1000}}}}})
+        ledger = ledger_for(db)
+        ledger.restore("1", {"5": [100, 1, 900], "6": [80, 0, 950]}, dirty=["6"])
+        ledger.award("1", "5", 10, CURVE, 2000)
+        await ledger.flush_all()
+
+        # kein Level und kein absoluter Wert für unverified User, 6 wartet auf den Abgleich
+        assert db.updates[-1][1] == {"5/xp": {".sv": {"increment": 10}}, "5/last_message_time": 2000}
+        assert ledger.restored_dirty["1"] == {"6"} and not ledger.dirty
+
+        adopted = await ledger.reconcile_guild("1", lambda: db.query("servers/1/users", "last_message_time", 900))
+        assert adopted == 1
+        assert ledger.users["1"].get(5).as_dict() == {"xp": 510, "level": 5, "last_message_time": 2000}
+        assert ledger.unverified == {} and ledger.restored_dirty == {}
+
+        # 6 ist in der Datenbank nicht neuer als im Snapshot, also gilt der lokale Stand
+        await ledger.flush_all()
+        assert await db.get("servers/1/users/6") == {"xp": 80, "level": 0, "last_message_time": 950}
+
+    asyncio.run(run())
+
+
+def test_restored_dirty_user_adopts_newer_database_value():
+    async def run():
+        db = FakeDB(data={"servers": {"1": {"users": {"6": {"xp": 120, "level": 1, "last_message_time": 990}}}}})
+        ledger = ledger_for(db)
+        ledger.restore("1", {"6": [80, 0, 950]}, dirty=["6"])
+        ledger.award("1", "6", 5, CURVE, 2000)
+
+        await ledger.reconcile_guild("1", lambda: db.query("servers/1/users", "last_message_time", 900))
+        # Datenbank plus noch nicht geschriebenes Inkrement
+        assert ledger.users["1"].get(6).xp == 125
+        await ledger.flush_all()
+        assert (await db.get("servers/1/users/6"))["xp"] == 125
+
+    asyncio.run(run())
+
+
+def test_load_guild_verifies_restored_users():
+    async def run():
+        db = FakeDB(data={"servers": {"1": {"users": {"5": {"xp": 500, "level": 5, "last_message_time": 1000}}}}})
+        ledger = ledger_for(db)
+        ledger.restore("1", {"5": [100, 1, 900]})
+        store = await ledger.load_guild(1)
+        assert store.get(5).xp == 500
+        assert ledger.unverified == {}
+
+    asyncio.run(run())
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import actions
+
+
+class TicketStore:
+    """
+    Index der Support-Tickets pro Guild:
+    - `servers/{gid}/tickets/{user}`: letztes Ticket des Users (thread_id, open, ...)
+    - `servers/{gid}/ticket_threads/{thread}`: User-ID, damit das Schließen ohne Suche geht
+    Beide werden zusammen per Multi-Path-Update geschrieben. IDs werden als
+    Strings gespeichert, weil Snowflakes als JSON-Zahl Präzision verlieren.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.tickets = {}  # (guild_id, user_id) -> Eintrag oder None
+        self.threads = {}  # (guild_id, thread_id) -> user_id
+        self._creating = set()  # (guild_id, user_id), Ticket wird gerade erstellt
+
+    def claim(self, guild_id, user_id) -> bool:
+        """Merkt vor, dass der User gerade ein Ticket erstellt; False, wenn das schon läuft."""
+        key = (str(guild_id), str(user_id))
+        if key in self._creating:
+            return False
+        self._creating.add(key)
+        return True
+
+    def release(self, guild_id, user_id):
+        self._creating.discard((str(guild_id), str(user_id)))
+
+    def _path(self, guild_id) -> str:
+        return f"servers/{guild_id}"
+
+    async def get(self, guild_id, user_id):
+        key = (str(guild_id), str(user_id))
+        if key not in self.tickets:
+            ticket = await self.db.get(f"{self._path(guild_id)}/tickets/{user_id}")
+            self.tickets[key] = ticket if isinstance(ticket, dict) else None
+        return self.tickets[key]
+
+    async def get_open(self, guild_id, user_id):
+        """Thread-ID des offenen Tickets des Users oder None."""
+        ticket = await self.get(guild_id, user_id)
+        if ticket and ticket.get("open"):
+            return int(ticket["thread_id"])
+        return None
+
+    async def open(self, guild_id, user_id, thread_id: int, channel_id: int):
+        guild_id, user_id, thread_id = str(guild_id), str(user_id), str(thread_id)
+        ticket = {"thread_id": thread_id, "channel_id": str(channel_id), "open": True, "created_at": int(time.time())}
+        await self.db.update(self._path(guild_id), {
+            f"tickets/{user_id}": ticket,
+            f"ticket_threads/{thread_id}": user_id
+        })
+        self.tickets[(guild_id, user_id)] = ticket
+        self.threads[(guild_id, thread_id)] = user_id
+
+    async def close(self, guild_id, thread_id) -> bool:
+        """Markiert das Ticket zu `thread_id` als geschlossen. False, wenn es kein Ticket ist."""
+        guild_id, thread_id = str(guild_id), str(thread_id)
+        user_id = self.threads.pop((guild_id, thread_id), None)
+        if user_id is None:
+            user_id = await self.db.get(f"{self._path(guild_id)}/ticket_threads/{thread_id}")
+        if user_id is None:
+            return False
+
+        updates = {f"ticket_threads/{thread_id}": None}
+        ticket = await self.get(guild_id, user_id)
+        # nur schließen, wenn der User inzwischen kein neueres Ticket hat
+        if ticket and ticket.get("thread_id") == thread_id:
+            updates[f"tickets/{user_id}/open"] = False
+            updates[f"tickets/{user_id}/closed_at"] = int(time.time())
+            ticket.update(open=False, closed_at=updates[f"tickets/{user_id}/closed_at"])
+        await self.db.update(self._path(guild_id), updates)
+        return True
+
+
+def add_members(thread, members, queue):
+    """
+    Fügt `members` im Hintergrund über die ActionQueue (actions.py) zum
+    Thread hinzu: ein Bucket pro Thread, also nacheinander im Takt des
+    Rate-Limits der Route, 429 und 5xx werden mit Backoff wiederholt.
+    Wer trotzdem fehlt, wird im Thread erwähnt; eine Erwähnung fügt Member
+    mit Zugriff auf den Kanal dem privaten Thread hinzu.
+    Gibt ein Future zurück, das fertig ist, wenn alle Versuche durch sind.
+    """
+    futures = {
+        queue.submit(f"thread:{thread.id}:members", lambda member=member: thread.add_user(member),
+                     priority=actions.HIGH, key=("thread_member", thread.id, member.id)): member
+        for member in members
+    }
+
+    def report(_):
+        failed = []
+        for future, member in futures.items():
+            # abgebrochen heißt: die Queue wurde beim Beenden geleert
+            if not future.cancelled() and future.exception() is not None:
+                print(f"Could not add {member} to ticket {thread.id}: {future.exception()}", flush=True)
+                failed.append(member)
+        if failed:
+            text = "⚠️ Could not add " + ", ".join(member.mention for member in failed) + " automatically."
+            queue.submit(f"channel:{thread.id}", lambda: thread.send(text), priority=actions.HIGH)
+
+    done = asyncio.gather(*futures, return_exceptions=True)
+    done.add_done_callback(report)
+    return done
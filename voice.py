@@ -0,0 +1,80 @@
+import asyncio
+
+
+class TempVCRegistry:
+    """
+    Auto-VCs, die der Bot erstellt hat, pro Guild im Arbeitsspeicher.
+    Persistiert unter `servers/{gid}/temp_vcs/{channel}` (Wert: Besitzer),
+    damit sie nach einem Neustart wieder aufgeräumt werden können. Gelesen
+    wird nur einmal beim Start, Voice-Events brauchen keinen Datenbankzugriff.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.channels = {}  # guild_id -> {channel_id: owner_id}
+        self._task = None
+
+    def _path(self, guild_id) -> str:
+        return f"servers/{guild_id}/temp_vcs"
+
+    async def load(self, guild_ids, concurrency: int = 5):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def load_guild(guild_id):
+            async with semaphore:
+                stored = await self.db.get(self._path(guild_id))
+            if isinstance(stored, dict):
+                channels = self.channels.setdefault(int(guild_id), {})
+                for channel_id, owner_id in stored.items():
+                    if str(channel_id).isdigit():
+                        channels[int(channel_id)] = int(owner_id)
+
+        await asyncio.gather(*(load_guild(guild_id) for guild_id in guild_ids))
+
+    def is_temp(self, guild_id, channel_id) -> bool:
+        return channel_id in self.channels.get(guild_id, ())
+
+    async def add(self, guild_id, channel_id, owner_id):
+        self.channels.setdefault(guild_id, {})[channel_id] = owner_id
+        await self.db.update(self._path(guild_id), {str(channel_id): str(owner_id)})
+
+    async def remove(self, guild_id, channel_id):
+        channels = self.channels.get(guild_id)
+        if not channels or channel_id not in channels:
+            return
+        del channels[channel_id]
+        if not channels:
+            del self.channels[guild_id]
+        await self.db.delete(f"{self._path(guild_id)}/{channel_id}")
+
+    def items(self) -> list:
+        """Alle (guild_id, channel_id) als Kopie, damit während des Durchlaufs entfernt werden kann."""
+        return [(guild_id, channel_id) for guild_id, channels in self.channels.items() for channel_id in channels]
+
+    async def _sweep_loop(self, sweep, interval: float, guild_ids, concurrency: int):
+        await self.load(guild_ids, concurrency)
+        # Auto-VCs, die während einer Downtime leer geworden sind, sofort aufräumen
+        try:
+            await sweep()
+        except Exception as e:
+            print(f"Temp VC sweep failed: {e}", flush=True)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await sweep()
+            except Exception as e:
+                print(f"Temp VC sweep failed: {e}", flush=True)
+
+    def start(self, sweep, interval: float = 300, guild_ids=(), concurrency: int = 5):
+        """
+        Lädt die Auto-VCs von `guild_ids`, ruft `sweep()` sofort und dann alle
+        `interval` Sekunden auf. Läuft das schon, passiert nichts (on_ready
+        kommt auch nach jedem Reconnect).
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweep_loop(sweep, interval, guild_ids, concurrency))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+
+import discord
+
+from atomic import KeyedLocks
+
+
+class WebhookPool:
+    """
+    Ein Webhook des Bots pro Kanal, der für alle Nachrichten wiederverwendet
+    wird; Name und Avatar werden pro Nachricht über `username`/`avatar_url`
+    gesetzt. Bereits vorhandene Webhooks des Bots werden übernommen, damit
+    das Limit an Webhooks pro Kanal nicht erreicht wird.
+    """
+
+    def __init__(self, name: str = "TigerBot", max_cached: int = 256):
+        self.name = name
+        self.max_cached = max_cached
+        self.webhooks = OrderedDict()  # channel_id -> discord.Webhook
+        self._creating = KeyedLocks("webhook")
+
+    async def get(self, channel) -> discord.Webhook:
+        webhook = self.webhooks.get(channel.id)
+        if webhook is not None:
+            self.webhooks.move_to_end(channel.id)
+            return webhook
+
+        async with self._creating.hold(channel.id):
+            webhook = self.webhooks.get(channel.id)
+            if webhook is None:
+                me = channel.guild.me
+                for existing in await channel.webhooks():
+                    if existing.token and existing.user is not None and existing.user.id == me.id and existing.name == self.name:
+                        webhook = existing
+                        break
+                else:
+                    webhook = await channel.create_webhook(name=self.name)
+                self.webhooks[channel.id] = webhook
+                while len(self.webhooks) > self.max_cached:
+                    self.webhooks.popitem(last=False)
+        return webhook
+
+    def invalidate(self, channel_id):
+        self.webhooks.pop(channel_id, None)
+
+    async def send(self, channel, username: str, avatar_url: str, **kwargs):
+        """
+        Sendet als `username` in `channel` (auch in Threads, dann über den
+        Webhook des Eltern-Kanals). Wurde der Webhook gelöscht, wird einmal
+        ein neuer angelegt.
+        """
+        parent = channel
+        if isinstance(channel, discord.Thread):
+            parent = channel.parent
+            kwargs["thread"] = channel
+        for attempt in range(2):
+            webhook = await self.get(parent)
+            try:
+                return await webhook.send(username=username, avatar_url=avatar_url, **kwargs)
+            except discord.NotFound:
+                self.invalidate(parent.id)
+                if attempt:
+                    raise
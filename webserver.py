@@ -0,0 +1,115 @@
+"""
+HTTP-Server des Bots (Keepalive, Health-Checks, Metriken, Statistiken).
+Läuft als aiohttp-App im Event-Loop des Bots, es gibt also keinen zweiten
+Thread; die Handler lesen nur den Zustand im Arbeitsspeicher.
+"""
+import asyncio
+import math
+import time
+
+from aiohttp import web
+
+import metrics
+
+
+class ReadinessCheck:
+    """
+    Bereit heißt: Gateway verbunden und Datenbank erreichbar. Das Ergebnis
+    des Datenbank-Pings wird `ttl` Sekunden gecacht, damit häufige Probes
+    keine Last erzeugen.
+    """
+
+    def __init__(self, bot, db, ttl: float = 10.0, timeout: float = 3.0):
+        self.bot = bot
+        self.db = db
+        self.ttl = ttl
+        self.timeout = timeout
+        self._checked_at = 0.0
+        self._db_ok = False
+        self._db_error = None
+
+    def gateway_ok(self) -> bool:
+        return self.bot.is_ready() and not self.bot.is_closed() and math.isfinite(self.bot.latency)
+
+    async def db_ok(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked_at >= self.ttl:
+            self._checked_at = now
+            try:
+                await asyncio.wait_for(self.db.get("_health"), self.timeout)
+                self._db_ok, self._db_error = True, None
+            except Exception as e:
+                self._db_ok, self._db_error = False, repr(e)
+        return self._db_ok
+
+    async def status(self) -> dict:
+        gateway = self.gateway_ok()
+        database = await self.db_ok()
+        status = {"ready": gateway and database, "gateway": gateway, "database": database}
+        if self._db_error:
+            status["database_error"] = self._db_error
+        return status
+
+
+def create_app(bot, db, guild_stats) -> web.Application:
+    """
+    `guild_stats(guild_id)` liefert ein JSON-fähiges dict für eine Guild
+    (oder None, wenn der Bot nicht auf dem Server ist).
+    """
+    readiness = ReadinessCheck(bot, db)
+    started = time.time()
+    routes = web.RouteTableDef()
+
+    @routes.get("/")
+    async def home(request):
+        return web.Response(text="Bot is running!")
+
+    @routes.get("/health")
+    async def health(request):
+        return web.json_response({"status": "ok", "uptime": int(time.time() - started)})
+
+    @routes.get("/ready")
+    async def ready(request):
+        status = await readiness.status()
+        return web.json_response(status, status=200 if status["ready"] else 503)
+
+    @routes.get("/metrics")
+    async def metrics_endpoint(request):
+        return web.Response(
+            body=metrics.registry.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    @routes.get("/stats")
+    async def stats(request):
+        latency = bot.latency
+        return web.json_response({
+            "guilds": len(bot.guilds),
+            "latency": latency if math.isfinite(latency) else None,
+            "uptime": int(time.time() - started),
+            "shard_ids": getattr(bot, "shard_ids", None) or ([bot.shard_id] if bot.shard_id is not None else None),
+            "shard_count": bot.shard_count,
+        })
+
+    @routes.get("/stats/{guild_id}")
+    async def stats_guild(request):
+        guild_id = request.match_info["guild_id"]
+        if not guild_id.isdigit():
+            raise web.HTTPBadRequest(text="guild_id must be numeric")
+        data = guild_stats(int(guild_id))
+        if data is None:
+            raise web.HTTPNotFound(text="unknown guild")
+        return web.json_response(data)
+
+    app = web.Application()
+    app.add_routes(routes)
+    return app
+
+
+async def start(app: web.Application, host: str = "0.0.0.0", port: int = 10000) -> web.AppRunner:
+    """Startet `app` im laufenden Event-Loop; zum Beenden `await runner.cleanup()`."""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Webserver listening on {host}:{port}", flush=True)
+    return runner
@@ -0,0 +1,360 @@
+import asyncio
+import time
+from collections import OrderedDict
+import schema
+from atomic import KeyedLocks
+from storage import increment_value
+from xpstore import GuildXPStore, MemberXP
+
+
+class CooldownTable:
+    """
+    Merkt sich pro Guild, wann ein User zuletzt XP bekommen hat, damit
+    Nachrichten im Cooldown ohne Datenbankzugriff verworfen werden.
+    Einträge sind nach letzter Vergabe sortiert; inaktive User (älter als
+    `max_idle`) und alles über `max_users_per_guild` fliegt vorne raus.
+    """
+
+    def __init__(self, max_users_per_guild: int = 10000, max_idle: float = 3600):
+        self.max_users_per_guild = max_users_per_guild
+        self.max_idle = max_idle
+        self.guilds = {}  # guild_id -> OrderedDict(user_id -> timestamp)
+
+    def in_cooldown(self, guild_id: int, user_id: int, cooldown: int, now: int) -> bool:
+        table = self.guilds.get(guild_id)
+        if table is None:
+            return False
+        last = table.get(user_id)
+        return last is not None and now - last < cooldown
+
+    def touch(self, guild_id: int, user_id: int, now: int):
+        table = self.guilds.get(guild_id)
+        if table is None:
+            table = self.guilds[guild_id] = OrderedDict()
+        table[user_id] = now
+        table.move_to_end(user_id)
+
+        # älteste Einträge verwerfen
+        while table:
+            oldest_user, oldest_time = next(iter(table.items()))
+            if len(table) > self.max_users_per_guild or now - oldest_time > self.max_idle:
+                del table[oldest_user]
+            else:
+                break
+
+
+class XPLedger:
+    """
+    Write-behind Speicher für XP:
+    XP und Level werden lokal berechnet, geänderte User werden pro Guild
+    gesammelt und als Multi-Path-Update geschrieben (per Timer oder sobald
+    `flush_threshold` User einer Guild dirty sind). Die Werte liegen
+    spaltenweise in einem xpstore.GuildXPStore pro Guild.
+
+    Vergebene XP werden als Server-Inkrement geschrieben (`deltas`), damit
+    parallele Schreiber (andere Prozesse, Dashboard) nichts überschreiben.
+    Absolute Werte gibt es nur nach Massenoperationen, für abgeglichene
+    Snapshot-Stände oder nach einem fehlgeschlagenen Flush (dann ist unklar,
+    ob das Inkrement angekommen ist, der absolute Wert ist dagegen idempotent).
+
+    Absolute Werte sind nur sicher, weil jede Guild genau einem Shard und
+    damit genau einem Prozess gehört (launcher.py): kein anderer Bot-Prozess
+    schreibt dieselben User. Wer Shards anders verteilt, darf für fremde
+    Guilds hier nichts puffern.
+
+    User aus dem Snapshot sind bis zum Abgleich mit der Datenbank (`verify`)
+    "unverified": die Datenbank kann nach einem Absturz neuer sein. Für sie
+    werden bis dahin nur Inkremente geschrieben, nie absolute Werte.
+    """
+
+    def __init__(self, db, user_defaults: dict, flush_interval: float = 30.0, flush_threshold: int = 50,
+                 flush_chunk: int = 500):
+        self.db = db
+        self.user_defaults = user_defaults
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.flush_chunk = flush_chunk  # höchstens so viele User pro Update
+
+        self.users = {}  # guild_id -> GuildXPStore
+        self.dirty = {}  # guild_id -> set(user_id)
+        self.deltas = {}  # guild_id -> {user_id: noch nicht geschriebene XP}, Teilmenge von dirty
+        self.complete = set()  # Guilds, deren User alle geladen sind (load_guild)
+        self.unverified = {}  # guild_id -> {user_id: last_message_time laut Snapshot}
+        self.restored_dirty = {}  # guild_id -> set(user_id), im Snapshot noch nicht geschrieben
+        self._task = None
+        self._flushing = {}  # guild_id -> laufender Flush-Task
+        self._loading = KeyedLocks("xp_user")
+        # Flush und Abgleich einer Guild schließen sich aus, sonst ist unklar,
+        # welche Inkremente im gelesenen Stand schon enthalten sind
+        self._writing = KeyedLocks("xp_flush")
+
+    def _store(self, guild_id) -> GuildXPStore:
+        store = self.users.get(guild_id)
+        if store is None:
+            store = self.users[guild_id] = GuildXPStore()
+        return store
+
+    def _set_from_db(self, store: GuildXPStore, user_id, data) -> MemberXP:
+        data = schema.overlay(self.user_defaults, data if isinstance(data, dict) else {})
+        return store.set(user_id, data.get("xp", 0), data.get("level", 0), data.get("last_message_time", 0))
+
+    async def get_user(self, guild_id, user_id) -> MemberXP:
+        guild_id, user_id = str(guild_id), str(user_id)
+        store = self._store(guild_id)
+        user = store.get(user_id)
+        if user is not None:
+            return user
+
+        # parallele Nachrichten desselben Users lesen nur einmal
+        async with self._loading.hold((guild_id, user_id)):
+            user = store.get(user_id)
+            if user is None:
+                data = await self.db.get(f"servers/{guild_id}/users/{user_id}") or {}
+                # load_guild könnte den User während des awaits geladen haben
+                user = store.get(user_id) or self._set_from_db(store, user_id, data)
+        return user
+
+    async def load_guild(self, guild_id) -> GuildXPStore:
+        """Lädt alle User einer Guild (für Massenoperationen), bereits geladene bleiben."""
+        guild_id = str(guild_id)
+        store = self._store(guild_id)
+        if guild_id in self.complete:
+            return store
+        async with self._writing.hold(guild_id):
+            users = await self.db.get(f"servers/{guild_id}/users") or {}
+            rows = []
+            for user_id, data in users.items():
+                if str(user_id).isdigit() and isinstance(data, dict):
+                    data = schema.overlay(self.user_defaults, data)
+                    rows.append((user_id, data.get("xp", 0), data.get("level", 0), data.get("last_message_time", 0)))
+            store.add_many(rows)
+            # vollständiger Stand, damit sind auch alle Snapshot-User abgeglichen
+            self._verify(guild_id, users)
+        self.complete.add(guild_id)
+        return store
+
+    def award(self, guild_id, user_id, xp_gain: int, curve, now: int = None):
+        """
+        Vergibt XP an einen bereits geladenen User (siehe get_user).
+        `curve` ist eine Levelkurve aus levels.py.
+        Gibt (alter Level, neuer Level, neue XP) zurück.
+        """
+        guild_id, user_id = str(guild_id), str(user_id)
+        user = self.users[guild_id].get(user_id)
+        now = int(time.time()) if now is None else now
+
+        old_level = user.level
+        new_xp = user.xp + xp_gain
+        # Level sinken nie, auch wenn die Kurve nachträglich steiler wird
+        new_level = max(old_level, curve.level_for_xp(new_xp))
+
+        user.xp = new_xp
+        user.level = new_level
+        user.last_message_time = now
+
+        dirty = self.dirty.get(guild_id)
+        deltas = self.deltas.setdefault(guild_id, {})
+        # steht schon ein absoluter Wert aus, enthält der die neuen XP bereits
+        # (nicht bei unverified Usern, deren absolute Werte warten auf den Abgleich)
+        if (user_id in deltas or not dirty or user_id not in dirty
+                or user_id in self.unverified.get(guild_id, ())):
+            deltas[user_id] = deltas.get(user_id, 0) + xp_gain
+        self._mark_dirty(guild_id, (user_id,))
+        return old_level, new_level, new_xp
+
+    def set_user(self, guild_id, user_id, xp: int, level: int, last_message_time: int):
+        """Übernimmt einen Stand, der schon so in der Datenbank steht (nicht dirty)."""
+        guild_id, user_id = str(guild_id), str(user_id)
+        self._store(guild_id).set(user_id, xp, level, last_message_time)
+        dirty = self.dirty.get(guild_id)
+        if dirty:
+            dirty.discard(user_id)
+        self.deltas.get(guild_id, {}).pop(user_id, None)
+        self.unverified.get(guild_id, {}).pop(user_id, None)
+        self.restored_dirty.get(guild_id, set()).discard(user_id)
+
+    def _mark_absolute(self, guild_id: str, user_ids):
+        """Markiert User dirty, geschrieben werden dann absolute Werte."""
+        user_ids = set(user_ids)
+        deltas = self.deltas.get(guild_id)
+        if deltas:
+            for user_id in user_ids:
+                deltas.pop(user_id, None)
+        self._mark_dirty(guild_id, user_ids)
+
+    def _mark_dirty(self, guild_id: str, user_ids):
+        dirty = self.dirty.setdefault(guild_id, set())
+        dirty.update(user_ids)
+        if len(dirty) >= self.flush_threshold and guild_id not in self._flushing:
+            self._flushing[guild_id] = asyncio.create_task(self.flush_guild(guild_id))
+
+    def restore(self, guild_id, rows: dict, dirty=()):
+        """
+        Übernimmt User aus dem lokalen Snapshot (user_id -> [xp, level, last_message_time]),
+        ohne bereits geladene zu überschreiben. Sie bleiben unverified, bis
+        `reconcile_guild` oder `load_guild` sie mit der Datenbank abgleicht.
+        """
+        guild_id = str(guild_id)
+        store = self._store(guild_id)
+        new = {str(user_id): values for user_id, values in rows.items() if user_id not in store}
+        store.add_many((user_id, *values) for user_id, values in new.items())
+        unverified = self.unverified.setdefault(guild_id, {})
+        for user_id, (_, _, last_message_time) in new.items():
+            unverified[user_id] = last_message_time
+        # erst nach dem Abgleich schreiben, die Datenbank könnte neuer sein
+        self.restored_dirty.setdefault(guild_id, set()).update(
+            user_id for user_id in map(str, dirty) if user_id in new)
+
+    async def reconcile_guild(self, guild_id, fetch) -> int:
+        """
+        Gleicht die unverified User einer Guild ab. `fetch()` liefert die seit
+        dem Snapshot geänderten User aus der Datenbank (user_id -> Daten), wer
+        dort fehlt, hat sich seitdem nicht geändert. Gibt die Anzahl der aus
+        der Datenbank übernommenen User zurück.
+        Schlägt `fetch` fehl, gilt der lokale Stand (siehe `_give_up`) und
+        der Fehler wird weitergereicht.
+        """
+        guild_id = str(guild_id)
+        async with self._writing.hold(guild_id):
+            try:
+                remote = await fetch() or {}
+            except Exception:
+                self._give_up(guild_id)
+                raise
+            return self._verify(guild_id, remote)
+
+    def writing(self, guild_id):
+        """Hält Flushes und Abgleich der Guild auf, solange der Kontext offen ist."""
+        return self._writing.hold(str(guild_id))
+
+    def _give_up(self, guild_id: str):
+        """
+        Abgleich nicht möglich: die User gelten als abgeglichen, damit Level
+        und zurückgehaltene Werte nicht für immer liegen bleiben. Wer im
+        Snapshot dirty war oder seitdem XP bekommen hat, wird absolut geschrieben.
+        """
+        unverified = self.unverified.pop(guild_id, {})
+        restored_dirty = self.restored_dirty.pop(guild_id, set())
+        dirty = self.dirty.get(guild_id, set())
+        write = restored_dirty | {user_id for user_id in unverified if user_id in dirty}
+        if write:
+            self._mark_absolute(guild_id, write)
+
+    def _verify(self, guild_id: str, remote: dict) -> int:
+        """
+        Übernimmt für unverified User den Stand aus `remote` plus die noch
+        nicht geschriebenen Inkremente. Nur wenn der User im Snapshot dirty
+        war und die Datenbank seitdem nicht neuer ist (verglichen mit der
+        last_message_time aus dem Snapshot, nicht der seitdem vergebenen),
+        gilt der lokale Stand und wird absolut geschrieben.
+        Muss unter `self._writing` für die Guild laufen.
+        """
+        unverified = self.unverified.pop(guild_id, {})
+        restored_dirty = self.restored_dirty.pop(guild_id, set())
+        store = self.users.get(guild_id)
+        deltas = self.deltas.get(guild_id, {})
+        adopted, keep = 0, []
+        for user_id, restored_time in unverified.items():
+            user = store.get(user_id) if store is not None else None
+            if user is None:
+                continue
+            stored = remote.get(user_id)
+            if isinstance(stored, dict):
+                data = schema.overlay(self.user_defaults, stored)
+                if user_id not in restored_dirty or data.get("last_message_time", 0) > restored_time:
+                    store.set(user_id, data.get("xp", 0) + deltas.get(user_id, 0),
+                              max(data.get("level", 0), user.level),
+                              max(data.get("last_message_time", 0), user.last_message_time))
+                    adopted += 1
+                    continue
+            if user_id in restored_dirty:
+                keep.append(user_id)
+        if keep:
+            self._mark_absolute(guild_id, keep)
+        return adopted
+
+    def cached_xp(self, guild_id) -> dict:
+        """user_id -> xp aller geladenen User einer Guild (inkl. noch nicht geschriebener Werte)."""
+        store = self.users.get(str(guild_id))
+        return store.xp_by_user() if store is not None else {}
+
+    async def bulk_update(self, guild_id, operation) -> int:
+        """
+        Wendet `operation(store)` (z.B. `lambda store: store.reset()`) auf alle
+        User der Guild an und schreibt das Ergebnis. Gibt die Anzahl User zurück.
+        """
+        guild_id = str(guild_id)
+        store = await self.load_guild(guild_id)
+        operation(store)
+        self._mark_absolute(guild_id, map(str, store.user_ids()))
+        await self.flush_guild(guild_id)
+        return len(store)
+
+    async def flush_guild(self, guild_id):
+        guild_id = str(guild_id)
+        try:
+            async with self._writing.hold(guild_id):
+                await self._flush(guild_id)
+        finally:
+            self._flushing.pop(guild_id, None)
+
+    async def _flush(self, guild_id: str):
+        dirty = self.dirty.pop(guild_id, None)
+        deltas = self.deltas.pop(guild_id, None) or {}
+        if not dirty:
+            return
+        store = self.users.get(guild_id)
+        unverified = self.unverified.get(guild_id, {})
+        held = set()
+        payloads = [{}]
+        for user_id in dirty:
+            user = store.get(user_id) if store is not None else None
+            if user is None:
+                continue
+            delta = deltas.get(user_id)
+            if delta is None and user_id in unverified:
+                # absoluter Wert erst nach dem Abgleich
+                held.add(user_id)
+                continue
+            if len(payloads[-1]) >= 3 * self.flush_chunk:
+                payloads.append({})
+            payload = payloads[-1]
+            payload[f"{user_id}/xp"] = increment_value(delta) if delta is not None else user.xp
+            if user_id not in unverified:
+                # der Level eines unverified Users beruht auf veralteten XP
+                payload[f"{user_id}/level"] = user.level
+            payload[f"{user_id}/last_message_time"] = user.last_message_time
+        if held:
+            self.dirty.setdefault(guild_id, set()).update(held)
+        try:
+            for payload in payloads:
+                if payload:
+                    await self.db.update(f"servers/{guild_id}/users", payload)
+        except Exception as e:
+            # beim nächsten Flush erneut versuchen, absolut
+            retry = self.deltas.get(guild_id, {})
+            for user_id in dirty:
+                retry.pop(user_id, None)
+            self.dirty.setdefault(guild_id, set()).update(dirty)
+            print(f"XP flush for guild {guild_id} failed: {e}", flush=True)
+
+    async def flush_all(self):
+        # laufende Threshold-Flushes abwarten, dann den Rest schreiben
+        if self._flushing:
+            await asyncio.gather(*self._flushing.values(), return_exceptions=True)
+        await asyncio.gather(*(self.flush_guild(guild_id) for guild_id in list(self.dirty)))
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush_all()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush_all()
@@ -0,0 +1,155 @@
+"""
+Spaltenweiser Speicher für XP, Level und letzte Nachricht aller Member
+einer Guild: vier `array('q')`-Spalten (ids, xp, level, last_message_time),
+nach User-ID sortiert. Die ID-Spalte ist zugleich die Zuordnung
+user_id -> Slot (Binärsuche), ein Member kostet so 32 Bytes statt eines
+dicts mit mehreren hundert Bytes.
+"""
+from array import array
+from bisect import bisect_left
+
+
+class MemberXP:
+    """
+    Sicht auf einen Member, Änderungen gehen direkt in die Spalten. Der Slot
+    wird bei jedem Zugriff neu gesucht, weil Einfügungen die Slots verschieben.
+    """
+
+    __slots__ = ("_store", "user_id")
+
+    def __init__(self, store: "GuildXPStore", user_id: int):
+        self._store = store
+        self.user_id = user_id
+
+    def _slot(self) -> int:
+        return self._store.slot(self.user_id)
+
+    @property
+    def xp(self) -> int:
+        return self._store.xp[self._slot()]
+
+    @xp.setter
+    def xp(self, value: int):
+        self._store.xp[self._slot()] = value
+
+    @property
+    def level(self) -> int:
+        return self._store.level[self._slot()]
+
+    @level.setter
+    def level(self, value: int):
+        self._store.level[self._slot()] = value
+
+    @property
+    def last_message_time(self) -> int:
+        return self._store.last_message_time[self._slot()]
+
+    @last_message_time.setter
+    def last_message_time(self, value: int):
+        self._store.last_message_time[self._slot()] = value
+
+    def as_dict(self) -> dict:
+        slot = self._slot()
+        return {"xp": self._store.xp[slot], "level": self._store.level[slot],
+                "last_message_time": self._store.last_message_time[slot]}
+
+    def __repr__(self):
+        return f"MemberXP(user_id={self.user_id}, xp={self.xp}, level={self.level})"
+
+
+class GuildXPStore:
+    __slots__ = ("ids", "xp", "level", "last_message_time")
+
+    def __init__(self):
+        self.ids = array("q")
+        self.xp = array("q")
+        self.level = array("q")
+        self.last_message_time = array("q")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _find(self, user_id: int) -> int:
+        return bisect_left(self.ids, user_id)
+
+    def slot(self, user_id) -> int:
+        user_id = int(user_id)
+        slot = self._find(user_id)
+        if slot == len(self.ids) or self.ids[slot] != user_id:
+            raise KeyError(user_id)
+        return slot
+
+    def __contains__(self, user_id) -> bool:
+        user_id = int(user_id)
+        slot = self._find(user_id)
+        return slot < len(self.ids) and self.ids[slot] == user_id
+
+    def get(self, user_id):
+        return MemberXP(self, int(user_id)) if user_id in self else None
+
+    def set(self, user_id, xp: int = 0, level: int = 0, last_message_time: int = 0) -> MemberXP:
+        user_id = int(user_id)
+        slot = self._find(user_id)
+        if slot < len(self.ids) and self.ids[slot] == user_id:
+            self.xp[slot] = xp
+            self.level[slot] = level
+            self.last_message_time[slot] = last_message_time
+        else:
+            self.ids.insert(slot, user_id)
+            self.xp.insert(slot, xp)
+            self.level.insert(slot, level)
+            self.last_message_time.insert(slot, last_message_time)
+        return MemberXP(self, user_id)
+
+    def setdefault(self, user_id, xp: int = 0, level: int = 0, last_message_time: int = 0) -> MemberXP:
+        existing = self.get(user_id)
+        return existing if existing is not None else self.set(user_id, xp, level, last_message_time)
+
+    def add_many(self, rows):
+        """
+        Fügt viele (user_id, xp, level, last_message_time) auf einmal ein, in
+        O(n log n) statt einzeln. Bereits vorhandene User bleiben unverändert.
+        """
+        new = {int(row[0]): tuple(row[1:]) for row in rows if row[0] not in self}
+        if not new:
+            return
+        merged = sorted([*self.rows(), *((user_id, *values) for user_id, values in new.items())])
+        self.ids = array("q", [row[0] for row in merged])
+        self.xp = array("q", [row[1] for row in merged])
+        self.level = array("q", [row[2] for row in merged])
+        self.last_message_time = array("q", [row[3] for row in merged])
+
+    def user_ids(self) -> list:
+        return self.ids.tolist()
+
+    def xp_by_user(self) -> dict:
+        return dict(zip(self.ids, self.xp))
+
+    def rows(self):
+        """(user_id, xp, level, last_message_time) für alle Member, nach ID sortiert."""
+        return zip(self.ids, self.xp, self.level, self.last_message_time)
+
+    # --- Massenoperationen über ganze Spalten
+
+    def reset(self):
+        """Setzt XP und Level aller Member auf 0 (last_message_time bleibt für den Cooldown)."""
+        zeros = bytes(8 * len(self.ids))
+        self.xp = array("q", zeros)
+        self.level = array("q", zeros)
+
+    def multiply(self, factor: float, curve=None):
+        """Multipliziert alle XP mit `factor` (z.B. 2.0 für ein Event, 0.9 als Verfall)."""
+        self.xp = array("q", [int(xp * factor) for xp in self.xp])
+        if curve is not None:
+            self.recompute_levels(curve)
+
+    def decay(self, amount: int, curve=None):
+        """Zieht allen Membern `amount` XP ab, höchstens bis 0."""
+        self.xp = array("q", [xp - amount if xp > amount else 0 for xp in self.xp])
+        if curve is not None:
+            self.recompute_levels(curve)
+
+    def recompute_levels(self, curve):
+        """Level aller Member aus den XP neu berechnen (Level können dabei sinken)."""
+        level_for_xp = curve.level_for_xp
+        self.level = array("q", [level_for_xp(xp) for xp in self.xp])